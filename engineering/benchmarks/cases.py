@@ -0,0 +1,75 @@
+import os
+import pandas as pd
+from ..io.paths import PROJECT_ROOT, resolve_dataset_path
+
+def _dataset(limit):
+    p = resolve_dataset_path('kaggle_dataset.csv')
+    if p is None:
+        raise FileNotFoundError("kaggle_dataset.csv not found; set PROJECT_ROOT or KAGGLE_DATASET_PATH")
+    from ..db.locator import get_db_path
+    df = pd.read_csv(str(p))
+    df = df[df['target_db'].apply(lambda d: isinstance(d, str) and bool(get_db_path(d)))]
+    # a fixed, db-interleaved slice so every run measures the same work
+    df = df.sample(frac=1, random_state=0).reset_index(drop=True)
+    return df.head(limit) if limit > 0 else df
+
+def _db_paths():
+    # every database name under either root, resolved through get_db_path exactly as a run would
+    from ..io.paths import DB_ROOT_DIR
+    from ..db.locator import get_db_path
+    names = set()
+    for root in (DB_ROOT_DIR, PROJECT_ROOT / 'databases'):
+        root = root.expanduser()
+        names.update(p.parent.name for p in root.glob("*/*.sqlite"))
+        names.update(p.stem for p in root.glob("*.sqlite"))
+    paths = sorted({get_db_path(n) for n in names} - {None})
+    if not paths:
+        raise FileNotFoundError("no .sqlite databases found; set DB_ROOT_DIR or PROJECT_ROOT")
+    return paths
+
+def case_clean_query(opts):
+    from ..utils.sanitize import clean_query
+    df = _dataset(opts['samples'])
+    replies = [(f"Here is the query:\n```sql\n{sql};\n```\nIt counts the rows.",) for sql in df['sql']]
+    return clean_query, replies
+
+def case_generate_db_schema(opts):
+    from ..db.schema import generate_db_schema
+    return generate_db_schema, [(p,) for p in _db_paths()]
+
+def case_evalfunc(opts):
+    from ..db.exec import evalfunc
+    from ..db.locator import get_db_path
+    df = _dataset(opts['samples'])
+    return evalfunc, [(sql, sql, get_db_path(db)) for sql, db in zip(df['sql'], df['target_db'])]
+
+def _fewshot_store():
+    from ..pipeline import load_fewshot_store
+    qb_dir = os.getenv('KAGGLE_QUESTION_BANK_DIR', str(PROJECT_ROOT / 'KaggleDBQA-main' / 'examples'))
+    return load_fewshot_store(qb_dir, embed_model=os.getenv('EMBED_MODEL', 'text-embedding-ada-002'))
+
+def case_similarity_search(opts):
+    store = _fewshot_store()
+    df = _dataset(opts['samples'])
+    return (lambda q: store.similarity_search(q, k=3)), [(str(q),) for q in df['nl']]
+
+def _sample_case(func_name, module):
+    def case(opts):
+        import importlib
+        func = getattr(importlib.import_module(module, __package__), func_name)
+        df = _dataset(opts['samples'])
+        vs = _fewshot_store() if opts['shots'] > 0 else None
+        args = [((idx, row, 'mock', opts['rounds'], opts['shots'], vs),) for idx, row in df.iterrows()]
+        return func, args
+    return case
+
+# name -> setup(opts) returning (fn, [args tuples])
+CASES = {
+    'clean_query': case_clean_query,
+    'generate_db_schema': case_generate_db_schema,
+    'evalfunc': case_evalfunc,
+    'similarity_search': case_similarity_search,
+    'run_m1_sample': _sample_case('run_m1_sample', '..experiments.baseline'),
+    'run_m2_sample': _sample_case('run_m2_sample', '..experiments.sphinteract'),
+    'run_m3_sample': _sample_case('run_m3_sample', '..experiments.break_no_ambiguity'),
+}
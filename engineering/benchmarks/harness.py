@@ -0,0 +1,113 @@
+import concurrent.futures
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+
+def percentile(sorted_vals, q):
+    if not sorted_vals:
+        return 0.0
+    # nearest-rank, so p99 of a small run is an observed latency rather than an interpolation
+    k = max(0, min(len(sorted_vals) - 1, math.ceil(q / 100.0 * len(sorted_vals)) - 1))
+    return sorted_vals[k]
+
+def measure(fn, inputs, repeat=1, warmup=1, workers=1):
+    """Call fn(*args) for every args in `inputs`, `repeat` times, and summarise the latencies.
+
+    The first `warmup` inputs are run once beforehand and not counted. With workers > 1 the
+    calls are spread over a thread pool, so throughput reflects concurrent execution.
+    """
+    inputs = list(inputs)
+    if not inputs:
+        # an empty case would report 0 ops/s as if it were a measurement
+        raise ValueError("measure() needs at least one input")
+    for args in inputs[:warmup]:
+        fn(*args)
+    jobs = inputs * max(1, repeat)
+
+    def timed(args):
+        t0 = time.perf_counter_ns()
+        fn(*args)
+        return time.perf_counter_ns() - t0
+
+    start = time.perf_counter()
+    if workers > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as ex:
+            lat = list(ex.map(timed, jobs))
+    else:
+        lat = [timed(args) for args in jobs]
+    wall = time.perf_counter() - start
+    ms = sorted(x / 1e6 for x in lat)
+    return {
+        'ops': len(ms),
+        'wall_s': wall,
+        'throughput': len(ms) / wall if wall > 0 else 0.0,
+        'mean_ms': sum(ms) / len(ms) if ms else 0.0,
+        'p50_ms': percentile(ms, 50),
+        'p95_ms': percentile(ms, 95),
+        'p99_ms': percentile(ms, 99),
+        'max_ms': ms[-1] if ms else 0.0,
+    }
+
+def git_commit(cwd=None):
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=cwd, capture_output=True, text=True, timeout=10)
+        sha = out.stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=cwd, capture_output=True, text=True, timeout=30)
+        return sha + ("-dirty" if dirty.stdout.strip() else "") if sha else None
+    except Exception:
+        return None
+
+def run_metadata(args):
+    return {
+        'commit': git_commit(),
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'args': args,
+    }
+
+def compare(results, baseline, threshold):
+    """Return [(case, metric, base, now, change)] for cases that got slower than `threshold`."""
+    regressions = []
+    for name, now in results.items():
+        base = baseline.get(name)
+        if not base or 'error' in now or 'error' in base:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            b, n = base.get(metric, 0.0), now.get(metric, 0.0)
+            # sub-millisecond medians are dominated by timer noise
+            if b >= 0.05 and n > b * (1 + threshold):
+                regressions.append((name, metric, b, n, n / b - 1))
+        b, n = base.get('throughput', 0.0), now.get('throughput', 0.0)
+        if b > 0 and n < b / (1 + threshold):
+            regressions.append((name, 'throughput', b, n, n / b - 1))
+    return regressions
+
+def load_json(path):
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_json(path, payload):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False)
+    return path
@@ -0,0 +1,134 @@
+"""End-to-end benchmarks against the bundled databases with the mock LLM.
+
+    python -m engineering.benchmarks.run                        # run everything, compare to the baseline
+    python -m engineering.benchmarks.run --save-baseline        # record the current numbers as the baseline
+    python -m engineering.benchmarks.run --only evalfunc,run_m2_sample --samples 100
+
+Each case runs in a fresh interpreter so its peak RSS is its own.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+# the suite measures the pipeline, not a provider or the console
+_BENCH_ENV = {
+    'LLM_MODE': 'mock',
+    'EMBED_MODE': 'mock',
+    'TRACE': 'off',
+    'LLM_METRICS': '0',
+    'PIPELINE_CHECKPOINT_DISABLE': '1',
+}
+
+def _run_case(name, opts, conn):
+    try:
+        from engineering.benchmarks.cases import CASES
+        from engineering.benchmarks.harness import measure, peak_rss_mb
+        t0 = time.perf_counter()
+        fn, inputs = CASES[name](opts)
+        setup_s = time.perf_counter() - t0
+        rss_setup = peak_rss_mb()
+        res = measure(fn, inputs, repeat=opts['repeat'], warmup=opts['warmup'], workers=opts['workers'])
+        res.update({'setup_s': setup_s, 'rss_setup_mb': rss_setup, 'peak_rss_mb': peak_rss_mb()})
+        conn.send(res)
+    except Exception as e:
+        conn.send({'error': f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+def run_isolated(name, opts):
+    ctx = multiprocessing.get_context("spawn")
+    parent, child = ctx.Pipe(duplex=False)
+    p = ctx.Process(target=_run_case, args=(name, opts, child))
+    p.start()
+    child.close()
+    try:
+        res = parent.recv()
+    except EOFError:
+        res = {'error': f"benchmark process exited with code {p.exitcode}"}
+    p.join()
+    return res
+
+def _fmt(v, nd=2):
+    return "-" if v is None else f"{v:.{nd}f}"
+
+def print_table(results, baseline=None):
+    cols = ("case", "ops", "ops/s", "p50 ms", "p95 ms", "p99 ms", "peak MB", "vs base p50")
+    rows = []
+    for name, r in results.items():
+        if 'error' in r:
+            rows.append((name, "-", "-", "-", "-", "-", "-", r['error']))
+            continue
+        delta = "-"
+        b = (baseline or {}).get(name)
+        if b and b.get('p50_ms'):
+            delta = f"{(r['p50_ms'] / b['p50_ms'] - 1) * 100:+.1f}%"
+        rows.append((name, str(r['ops']), _fmt(r['throughput'], 1), _fmt(r['p50_ms'], 3), _fmt(r['p95_ms'], 3),
+                     _fmt(r['p99_ms'], 3), _fmt(r['peak_rss_mb'], 1), delta))
+    widths = [max(len(str(x)) for x in col) for col in zip(cols, *rows)]
+    for row in (cols,) + tuple(rows):
+        print("  ".join(str(x).ljust(w) for x, w in zip(row, widths)))
+
+def main(argv=None):
+    from engineering.benchmarks.cases import CASES
+    from engineering.benchmarks.harness import compare, load_json, run_metadata, save_json
+    from engineering.io.paths import PROJECT_ROOT
+    default_dir = PROJECT_ROOT / '.cache' / 'benchmarks'
+    parser = argparse.ArgumentParser(description="Sphinteract pipeline benchmarks (mock LLM)")
+    parser.add_argument("--only", default="", help="comma-separated cases: " + ",".join(CASES))
+    parser.add_argument("--samples", type=int, default=40, help="dataset rows per case (0 = all)")
+    parser.add_argument("--rounds", type=int, default=3, help="max_rounds for run_m*_sample")
+    parser.add_argument("--shots", type=int, default=0, help="few-shot examples for run_m*_sample")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=1, help="threads issuing calls concurrently")
+    parser.add_argument("--baseline", default=str(default_dir / 'baseline.json'))
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative slowdown reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--out", default=None, help="also write the results JSON here")
+    args = parser.parse_args(argv)
+    for k, v in _BENCH_ENV.items():
+        os.environ.setdefault(k, v)
+    names = [n.strip() for n in args.only.split(",") if n.strip()] or list(CASES)
+    unknown = [n for n in names if n not in CASES]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+    opts = {'samples': args.samples, 'rounds': args.rounds, 'shots': args.shots,
+            'repeat': args.repeat, 'warmup': args.warmup, 'workers': args.workers}
+    results = {}
+    for name in names:
+        print(f"[bench] {name} ...", flush=True)
+        results[name] = run_isolated(name, opts)
+    payload = {'meta': run_metadata(opts), 'results': results}
+    base = load_json(args.baseline)
+    base_results = base['results'] if base else None
+    if base:
+        print(f"baseline: {args.baseline} (commit {base['meta'].get('commit')}, {base['meta'].get('timestamp')})")
+    print_table(results, base_results)
+    # every run is kept, so a series across commits can be plotted later
+    history = default_dir / 'history.jsonl'
+    history.parent.mkdir(parents=True, exist_ok=True)
+    with open(history, "a", encoding="utf-8") as f:
+        f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+    if args.out:
+        save_json(args.out, payload)
+    if args.save_baseline:
+        print(f"baseline saved to {save_json(args.baseline, payload)}")
+        return 0
+    if base_results:
+        if base['meta'].get('args') != opts:
+            print("note: baseline was recorded with different options; comparison is indicative only")
+        regressions = compare(results, base_results, args.threshold)
+        for name, metric, b, n, change in regressions:
+            print(f"REGRESSION {name} {metric}: {b:.3f} -> {n:.3f} ({change * 100:+.1f}%)")
+        if not regressions:
+            print(f"no regressions beyond {args.threshold:.0%}")
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from urllib.parse import quote
+from ..io.paths import PROJECT_ROOT
+from .gold_cache import db_file_hash
+
+_COLUMNS_SQL = (
+    "SELECT m.name, m.sql, p.cid, p.name, p.type, p.\"notnull\", p.dflt_value, p.pk "
+    "FROM sqlite_master AS m LEFT JOIN pragma_table_info(m.name) AS p "
+    "WHERE m.type = 'table' ORDER BY m.rowid, p.cid"
+)
+_FOREIGN_KEYS_SQL = (
+    "SELECT m.name, f.id, f.seq, f.\"table\", f.\"from\", f.\"to\" "
+    "FROM sqlite_master AS m JOIN pragma_foreign_key_list(m.name) AS f "
+    "WHERE m.type = 'table' ORDER BY m.rowid, f.id, f.seq"
+)
+
+_COUNT_CHUNK = 200
+
+def _quote_ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def introspect(db_path, row_counts=True):
+    """Read tables, columns, foreign keys and optionally row counts of a SQLite file.
+
+    Returns {'tables': [{'name', 'sql', 'columns', 'foreign_keys', 'row_count'}]} in
+    sqlite_master order, which is also the order generate_db_schema emits.
+    """
+    conn = sqlite3.connect(f"file:{quote(str(Path(db_path).resolve()))}?mode=ro", uri=True)
+    try:
+        tables = {}
+        for tname, tsql, cid, cname, ctype, notnull, dflt, pk in conn.execute(_COLUMNS_SQL):
+            t = tables.get(tname)
+            if t is None:
+                t = tables[tname] = {'name': tname, 'sql': tsql, 'columns': [], 'foreign_keys': [], 'row_count': None}
+            if cid is not None:
+                t['columns'].append({'name': cname, 'type': ctype, 'notnull': bool(notnull), 'default': dflt, 'pk': pk})
+        for tname, fid, seq, ref_table, from_col, to_col in conn.execute(_FOREIGN_KEYS_SQL):
+            tables[tname]['foreign_keys'].append({'id': fid, 'seq': seq, 'table': ref_table, 'from': from_col, 'to': to_col})
+        if row_counts and tables:
+            names = list(tables)
+            # chunked to stay under SQLITE_MAX_COMPOUND_SELECT (500 by default)
+            for i in range(0, len(names), _COUNT_CHUNK):
+                chunk = names[i:i + _COUNT_CHUNK]
+                sql = " UNION ALL ".join(f"SELECT ?, COUNT(*) FROM {_quote_ident(n)}" for n in chunk)
+                for tname, n in conn.execute(sql, chunk):
+                    tables[tname]['row_count'] = n
+        return {'tables': list(tables.values())}
+    finally:
+        conn.close()
+
+def render_schema(catalog):
+    # same text generate_db_schema builds from the CREATE statements
+    return "\n\n".join(t['sql'] for t in catalog['tables'] if t['name'] != 'sqlite_sequence')
+
+class SchemaCatalog:
+    """Schema introspection results persisted per database file.
+
+    Entries are keyed by the resolved path and validated against (mtime, size); when only
+    the mtime moved, a matching content hash revalidates the entry without introspecting.
+    """
+
+    def __init__(self, path=None, row_counts=True):
+        self.row_counts = row_counts
+        self.hits = 0
+        self.misses = 0
+        self._mem = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS catalog ("
+                "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, hash TEXT, payload TEXT, created_at REAL)"
+            )
+
+    def _load(self, path):
+        if self._conn is None:
+            return None
+        with self._lock:
+            return self._conn.execute("SELECT mtime_ns, size, hash, payload FROM catalog WHERE path=?", (path,)).fetchone()
+
+    def _store(self, path, mtime_ns, size, h, catalog):
+        if self._conn is None:
+            return
+        payload = json.dumps(catalog, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO catalog (path, mtime_ns, size, hash, payload, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (path, mtime_ns, size, h, payload, time.time()),
+            )
+
+    def get(self, db_path):
+        p = Path(db_path).resolve()
+        st = p.stat()
+        path, key = str(p), (st.st_mtime_ns, st.st_size)
+        mem = self._mem.get(path)
+        if mem is not None and mem[0] == key:
+            self.hits += 1
+            return mem[1]
+        catalog = None
+        row = self._load(path)
+        if row is not None and (row[0], row[1]) == key:
+            catalog = json.loads(row[3])
+        elif row is not None and row[1] == st.st_size and row[2] == db_file_hash(p):
+            # touched but unchanged: keep the entry and record the new mtime
+            catalog = json.loads(row[3])
+            self._store(path, st.st_mtime_ns, st.st_size, row[2], catalog)
+        if catalog is None:
+            self.misses += 1
+            catalog = introspect(p, row_counts=self.row_counts)
+            self._store(path, st.st_mtime_ns, st.st_size, db_file_hash(p) if self._conn is not None else None, catalog)
+        else:
+            self.hits += 1
+        self._mem[path] = (key, catalog)
+        return catalog
+
+    def schema_text(self, db_path):
+        return render_schema(self.get(db_path))
+
+    def stats(self):
+        return {'entries': len(self._mem), 'hits': self.hits, 'misses': self.misses}
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def get_schema_catalog():
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                path = None
+                if os.getenv("SCHEMA_CATALOG_DISK", "1") == "1":
+                    path = os.getenv("SCHEMA_CATALOG_PATH", str(PROJECT_ROOT / ".cache" / "schema_catalog.sqlite"))
+                row_counts = os.getenv("SCHEMA_CATALOG_ROW_COUNTS", "1") == "1"
+                try:
+                    _catalog = SchemaCatalog(path, row_counts=row_counts)
+                except Exception as e:
+                    print(f"[ERROR] schema catalog store unavailable ({e}); keeping it in memory")
+                    _catalog = SchemaCatalog(None, row_counts=row_counts)
+    return _catalog
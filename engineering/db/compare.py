@@ -0,0 +1,142 @@
+import hashlib
+import itertools
+import os
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+_MASK = (1 << 128) - 1
+
+def float_decimals():
+    # RESULT_FLOAT_DECIMALS=6 rounds floats to 6 places before hashing; unset means exact. This is
+    # rounding, not a tolerance: values either side of a rounding boundary still differ
+    v = os.getenv("RESULT_FLOAT_DECIMALS", "")
+    try:
+        return int(v) if v != "" else None
+    except Exception:
+        return None
+
+if xxhash is not None:
+    _row_hash = xxhash.xxh3_128_intdigest
+    _stream_hasher = xxhash.xxh3_128
+else:
+    def _row_hash(data):
+        return int.from_bytes(hashlib.blake2b(data, digest_size=16).digest(), "little")
+    def _stream_hasher():
+        return hashlib.blake2b(digest_size=16)
+
+def _normalize_chunk(chunk, decimals):
+    # 1.0 == 1 in Python (and in the old comparison), so integral floats are hashed as ints;
+    # only columns that actually hold floats are touched
+    if float not in set(map(type, itertools.chain.from_iterable(chunk))):
+        return chunk
+    cols = list(zip(*chunk))
+    for j, col in enumerate(cols):
+        if float not in set(map(type, col)):
+            continue
+        if decimals is not None:
+            col = [round(v, decimals) if type(v) is float else v for v in col]
+        cols[j] = [int(v) if type(v) is float and v.is_integer() else v for v in col]
+    return list(zip(*cols))
+
+class ResultDigest:
+    """Constant-size fingerprint of a result set.
+
+    Each row is encoded as the repr of its typed tuple. `ordered_hash` is a streaming hash
+    over the row sequence and `multiset_hash` is the sum of 128-bit row hashes, so an
+    unordered comparison is a multiset check that needs neither sorting nor the rows.
+    """
+
+    __slots__ = ("row_count", "col_count", "byte_count", "truncated", "ordered_hash", "multiset_hash", "_hasher")
+
+    def __init__(self, col_count=0):
+        self.row_count = 0
+        self.col_count = col_count
+        self.byte_count = 0
+        self.truncated = False
+        self.ordered_hash = None
+        self.multiset_hash = 0
+        self._hasher = _stream_hasher()
+
+    def add_rows(self, chunk, decimals=None):
+        if not chunk:
+            return
+        if not self.col_count:
+            self.col_count = len(chunk[0])
+        encoded = list(map(str.encode, map(repr, _normalize_chunk(chunk, decimals))))
+        self.multiset_hash = (self.multiset_hash + sum(map(_row_hash, encoded))) & _MASK
+        # repr never emits a raw newline, so it is a safe row separator
+        self._hasher.update(b"\n".join(encoded) + b"\n")
+        self.row_count += len(chunk)
+        self.byte_count += sum(map(len, encoded))
+
+    def finish(self):
+        if self._hasher is not None:
+            self.ordered_hash = self._hasher.hexdigest()
+            self._hasher = None
+        return self
+
+    def matches(self, other, ordered):
+        if self.truncated or other.truncated:
+            # a capped result is only a prefix, so equality cannot be established
+            return False
+        if self.row_count != other.row_count:
+            return False
+        if self.row_count == 0:
+            return True
+        if self.col_count != other.col_count:
+            return False
+        if ordered:
+            return self.ordered_hash == other.ordered_hash
+        return self.multiset_hash == other.multiset_hash
+
+    def __getstate__(self):
+        self.finish()
+        return {k: getattr(self, k) for k in self.__slots__ if k != "_hasher"}
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+        self._hasher = None
+
+    def __repr__(self):
+        return f"ResultDigest(rows={self.row_count}, cols={self.col_count}, bytes={self.byte_count}, truncated={self.truncated}, ordered={self.ordered_hash}, multiset={self.multiset_hash:032x})"
+
+def digest_rows(rows, decimals=None, chunk_size=1000):
+    rows = list(rows)
+    d = ResultDigest()
+    for i in range(0, len(rows), chunk_size):
+        d.add_rows(rows[i:i+chunk_size], decimals)
+    return d.finish()
+
+def digest_cursor(cursor, chunk_size=1000, decimals=None, max_rows=None, max_bytes=None):
+    """Stream `cursor` with fetchmany into a ResultDigest.
+
+    Fetching stops once `max_rows` rows or `max_bytes` encoded bytes have been seen and
+    the digest is marked truncated, so a runaway join cannot exhaust memory or time.
+    """
+    d = ResultDigest(len(cursor.description) if cursor.description else 0)
+    while True:
+        chunk = cursor.fetchmany(chunk_size)
+        if not chunk:
+            break
+        d.add_rows(chunk, decimals)
+        if (max_rows and d.row_count >= max_rows) or (max_bytes and d.byte_count >= max_bytes):
+            # only truncated if something is actually left behind
+            d.truncated = bool(cursor.fetchmany(1))
+            break
+    return d.finish()
+
+def fetch_budget():
+    def env_int(name, default):
+        try:
+            return int(os.getenv(name, str(default)))
+        except Exception:
+            return default
+    return {
+        'chunk_size': max(1, env_int("SQL_FETCH_CHUNK", 1000)),
+        'max_rows': env_int("SQL_MAX_ROWS", 1000000) or None,
+        'max_bytes': env_int("SQL_MAX_BYTES", 256 * 1024 * 1024) or None,
+    }
@@ -0,0 +1,122 @@
+import os
+from .compare import float_decimals
+from .exec import result_digest, sql_timeout
+from .pool import get_sqlite_pool
+
+def _cluster_key(i, digest):
+    if digest.truncated:
+        # a capped result cannot be shown equal to anything, so it stays alone
+        return ("truncated", i)
+    if digest.row_count == 0:
+        return ("empty",)
+    # matches(ordered=False) compares exactly these fields
+    return (digest.row_count, digest.col_count, digest.multiset_hash)
+
+def cluster_by_result(sqls, db_path, cache=None):
+    """Execute every distinct SQL and group indices whose results match as multisets.
+
+    Returns (clusters, digests, failed): clusters are index lists, largest first, ties by
+    earliest member; `digests` maps each SQL to its ResultDigest or None if it failed.
+    `cache`, a dict of the same shape kept by the caller, is consulted first and filled in,
+    so a SQL already run against `db_path` is not executed again.
+    """
+    cache = {} if cache is None else cache
+    digests = {}
+    for sql in dict.fromkeys(sqls):
+        if sql not in cache:
+            try:
+                cache[sql] = result_digest(sql, db_path)
+            except Exception:
+                cache[sql] = None
+        digests[sql] = cache[sql]
+    groups = {}
+    failed = 0
+    for i, sql in enumerate(sqls):
+        d = digests[sql]
+        if d is None:
+            failed += 1
+            continue
+        groups.setdefault(_cluster_key(i, d), []).append(i)
+    clusters = sorted(groups.values(), key=lambda c: (-len(c), c[0]))
+    return clusters, digests, failed
+
+def divergence_check_enabled():
+    # M3_DIVERGENCE_CHECK=0 restores the SRA call in every round
+    return os.getenv("M3_DIVERGENCE_CHECK", "1") == "1"
+
+class Divergence:
+    __slots__ = ("agree", "summary")
+
+    def __init__(self, agree, summary=""):
+        self.agree = agree
+        self.summary = summary
+
+def _fmt_row(row, width=60):
+    s = repr(tuple(row))
+    return s if len(s) <= width else s[:width - 3] + "..."
+
+def _normalized(rows, decimals):
+    if decimals is None:
+        return rows
+    return [tuple(round(v, decimals) if type(v) is float else v for v in r) for r in rows]
+
+def summarize_divergence(sqls, reps, digests, db_path, preview_rows=50, show_rows=3, cache=None):
+    """Describe how the results of `reps` (indices into `sqls`) differ, for a clarification prompt.
+
+    `cache` maps SQL -> (columns, rows) previews already fetched for this database.
+    """
+    timeout = sql_timeout()
+    decimals = float_decimals()
+    cache = {} if cache is None else cache
+    previews = {}
+    for i in reps:
+        if sqls[i] not in cache:
+            try:
+                cache[sqls[i]] = get_sqlite_pool().preview(db_path, sqls[i], timeout=timeout, max_rows=preview_rows)
+            except Exception:
+                cache[sqls[i]] = ([], [])
+        cols, rows = cache[sqls[i]]
+        previews[i] = (cols, set(_normalized(rows, decimals)), rows)
+    lines = ["/* The incorrect sql answers above return different results: */"]
+    for i in reps:
+        d = digests[sqls[i]]
+        cols = previews[i][0]
+        rows = f"{d.row_count}{'+' if d.truncated else ''} rows"
+        lines.append(f"-- answer {i + 1}: {rows}; columns: {', '.join(cols) or '-'}")
+    for i in reps:
+        cols, _, rows = previews[i]
+        others = [previews[j] for j in reps if j != i]
+        other_cols = {c.lower() for o in others for c in o[0]}
+        only_cols = [c for c in cols if c.lower() not in other_cols]
+        if only_cols:
+            lines.append(f"-- columns only in answer {i + 1}: {', '.join(only_cols)}")
+        # rows are compared only when the shapes line up, otherwise every row differs trivially
+        same_shape = [o for o in others if len(o[0]) == len(cols)]
+        if not same_shape:
+            continue
+        seen = set().union(*(o[1] for o in same_shape))
+        only_rows = [r for r, n in zip(rows, _normalized(rows, decimals)) if n not in seen][:show_rows]
+        if only_rows:
+            lines.append(f"-- rows only in answer {i + 1}: " + "; ".join(_fmt_row(r) for r in only_rows))
+    return "\n".join(lines) + "\n"
+
+def history_divergence(sqls_history, db_path, cache=None, previews=None):
+    """Compare the results of the distinct SQLs tried so far.
+
+    Returns None when fewer than two of them execute (nothing to compare), otherwise a
+    Divergence whose `agree` says whether all results match and whose `summary` lists the
+    differing columns and rows. Pass the sample's digest `cache` (and `previews` for the
+    summary rows) so each round executes only the SQLs it added.
+    """
+    sqls = list(dict.fromkeys(sqls_history))
+    if len(sqls) < 2:
+        return None
+    clusters, digests, failed = cluster_by_result(sqls, db_path, cache)
+    if len(sqls) - failed < 2:
+        return None
+    if len(clusters) == 1:
+        # different queries that all return nothing say little about the question's reading
+        if all(d is None or d.row_count == 0 for d in digests.values()):
+            return None
+        return Divergence(True)
+    return Divergence(False, summarize_divergence(sqls, [c[0] for c in clusters], digests, db_path, cache=previews))
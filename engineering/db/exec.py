@@ -1,44 +1,71 @@
 import sqlite3
 import os
 from multiprocessing import Process, Queue
+from urllib.parse import quote
+from .pool import get_sqlite_pool
+from .gold_cache import GoldResult, get_gold_cache
+from .compare import digest_cursor, fetch_budget, float_decimals
 
-def execute_query_worker(db_path, sql, output):
+def sql_timeout():
     try:
-        conn = sqlite3.connect(db_path)
+        return float(os.getenv("SQL_TIMEOUT", "30"))
+    except Exception:
+        return 30.0
+
+def execute_query_worker(db_path, sql, output, budget=None, decimals=None):
+    # streams rows with fetchmany and ships back a compact ResultDigest, never the row list
+    try:
+        conn = sqlite3.connect(f"file:{quote(str(db_path))}?mode=ro", uri=True)
         cursor = conn.cursor()
-        results = cursor.execute(sql).fetchall()
+        digest = digest_cursor(cursor.execute(sql), decimals=decimals, **(budget or {}))
         conn.close()
-        output.put(results)
+        output.put(digest)
     except Exception as e:
         output.put(e)
 
-def evalfunc(sql_source, sql_target, db_path):
-    if not os.path.isfile(db_path):
-        return False, [FileNotFoundError(f"Database not found: {db_path}")]
-    timeout = 30
+def _execute_in_process(db_path, sql, timeout, budget, decimals):
     output = Queue()
-    p = Process(target=execute_query_worker, args=(db_path, sql_source, output))
+    p = Process(target=execute_query_worker, args=(db_path, sql, output, budget, decimals))
     p.start()
     try:
-        source_results = output.get(timeout=timeout)
+        results = output.get(timeout=timeout)
         p.join()
-        if isinstance(source_results, Exception):
-            return False, [source_results]
-    except Exception as e:
+    except Exception:
         p.terminate()
+        raise
+    if isinstance(results, Exception):
+        raise results
+    return results
+
+def _digest(db_path, sql, timeout):
+    decimals = float_decimals()
+    budget = fetch_budget()
+    # SQL_EXECUTOR=process keeps the old one-process-per-query isolation
+    if os.getenv("SQL_EXECUTOR", "pool").lower() == "process":
+        return _execute_in_process(db_path, sql, timeout, budget, decimals)
+    return get_sqlite_pool().digest(db_path, sql, timeout=timeout, decimals=decimals, **budget)
+
+def result_digest(sql, db_path):
+    """ResultDigest of `sql` under the same executor, timeout and fetch budget as evalfunc; raises on failure."""
+    return _digest(db_path, sql, sql_timeout())
+
+def evalfunc(sql_source, sql_target, db_path):
+    if not os.path.isfile(db_path):
+        return False, [FileNotFoundError(f"Database not found: {db_path}")]
+    timeout = sql_timeout()
+    try:
+        source = _digest(db_path, sql_source, timeout)
+    except Exception as e:
         return False, [e]
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        target_results = cursor.execute(sql_target).fetchall()
-        conn.close()
+        gold = _gold_result(db_path, sql_target, timeout)
     except Exception as e:
         return False, [e]
-    if len(source_results) != len(target_results):
-        return False, []
-    if 'ORDER BY' in sql_target.upper():
-        return source_results == target_results, []
-    s_sorted = sorted(list(source_results), key=lambda x: str(x))
-    t_sorted = sorted(list(target_results), key=lambda x: str(x))
-    return s_sorted == t_sorted, []
+    return source.matches(gold.digest, gold.ordered), []
 
+def _gold_result(db_path, sql_target, timeout):
+    # gold queries are trusted, so only the chunk size applies and they are never truncated
+    compute = lambda: get_sqlite_pool().digest(db_path, sql_target, timeout=timeout, decimals=float_decimals(), chunk_size=fetch_budget()['chunk_size'])
+    if os.getenv("GOLD_CACHE", "1") != "1":
+        return GoldResult(GoldResult.is_ordered(sql_target), compute())
+    return get_gold_cache().get(db_path, sql_target, compute)
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import pickle
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from ..io.paths import PROJECT_ROOT
+from .compare import float_decimals
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+
+def db_file_hash(db_path):
+    # content hash memoized on (path, mtime, size) so each file is read at most once per change
+    p = Path(db_path).resolve()
+    st = p.stat()
+    key = (str(p), st.st_mtime_ns, st.st_size)
+    h = _file_hashes.get(key)
+    if h is not None:
+        return h
+    hasher = xxhash.xxh3_128() if xxhash is not None else hashlib.blake2b(digest_size=16)
+    with open(p, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(chunk)
+    h = hasher.hexdigest()
+    with _file_hashes_lock:
+        _file_hashes[key] = h
+    return h
+
+def normalize_sql(sql):
+    s = re.sub(r"\s+", " ", sql or "").strip()
+    return s.rstrip(";").strip()
+
+class GoldResult:
+    __slots__ = ("ordered", "digest")
+
+    def __init__(self, ordered, digest):
+        self.ordered = ordered
+        self.digest = digest
+
+    @property
+    def row_count(self):
+        return self.digest.row_count
+
+    @staticmethod
+    def is_ordered(sql):
+        return 'ORDER BY' in sql.upper()
+
+class GoldResultCache:
+    """Gold query results keyed by (db file hash, normalized SQL), in memory and optionally on disk."""
+
+    def __init__(self, max_entries=4096, disk_path=None):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._conn = None
+        if disk_path:
+            Path(disk_path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(disk_path), check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS gold (key TEXT PRIMARY KEY, payload BLOB)")
+
+    @staticmethod
+    def make_key(db_path, sql):
+        return hashlib.sha256(f"v3\x00{float_decimals()}\x00{db_file_hash(db_path)}\x00{normalize_sql(sql)}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, key):
+        with self._lock:
+            res = self._mem.get(key)
+            if res is not None:
+                self._mem.move_to_end(key)
+                return res
+            if self._conn is not None:
+                row = self._conn.execute("SELECT payload FROM gold WHERE key=?", (key,)).fetchone()
+                if row is not None:
+                    res = pickle.loads(row[0])
+                    self._remember(key, res)
+                    return res
+        return None
+
+    def _remember(self, key, res):
+        self._mem[key] = res
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def get(self, db_path, sql, compute):
+        """Return the GoldResult for `sql`, calling compute() for its ResultDigest only on a miss."""
+        key = self.make_key(db_path, sql)
+        res = self._lookup(key)
+        if res is not None:
+            self.hits += 1
+            return res
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # one thread computes a given gold result while others wait for it
+        with key_lock:
+            res = self._lookup(key)
+            if res is not None:
+                self.hits += 1
+                return res
+            self.misses += 1
+            res = GoldResult(GoldResult.is_ordered(sql), compute())
+            with self._lock:
+                self._remember(key, res)
+                self._key_locks.pop(key, None)
+                if self._conn is not None:
+                    self._conn.execute("INSERT OR REPLACE INTO gold (key, payload) VALUES (?, ?)", (key, pickle.dumps(res, protocol=pickle.HIGHEST_PROTOCOL)))
+            return res
+
+    def stats(self):
+        return {'entries': len(self._mem), 'hits': self.hits, 'misses': self.misses}
+
+_gold_cache = None
+_gold_cache_lock = threading.Lock()
+
+def get_gold_cache():
+    global _gold_cache
+    if _gold_cache is None:
+        with _gold_cache_lock:
+            if _gold_cache is None:
+                disk_path = None
+                if os.getenv("GOLD_CACHE_DISK", "0") == "1":
+                    disk_path = os.getenv("GOLD_CACHE_PATH", str(PROJECT_ROOT / ".cache" / "gold_results.sqlite"))
+                try:
+                    max_entries = int(os.getenv("GOLD_CACHE_MAX_ENTRIES", "4096"))
+                except Exception:
+                    max_entries = 4096
+                _gold_cache = GoldResultCache(max_entries=max_entries, disk_path=disk_path)
+    return _gold_cache
@@ -0,0 +1,285 @@
+import os
+import re
+import threading
+from pathlib import Path
+from .catalog import _quote_ident, render_schema
+from .locator import get_catalog, get_db_path
+from .pool import get_sqlite_pool
+from ..llm.ratelimit import estimate_tokens
+from ..utils.tracing import DEBUG, event
+
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+def _stem(w):
+    return w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w
+
+def identifier_tokens(name):
+    # "HomeTeam" -> {"home", "team"}, "FIRE_YEAR" -> {"fire", "year"}
+    out = set()
+    for part in _WORD_RE.findall(name or ""):
+        for w in _CAMEL_RE.findall(part) or [part]:
+            out.add(_stem(w.lower()))
+    return out
+
+def _text_tokens(text):
+    words = [w.lower() for w in _WORD_RE.findall(text or "")]
+    toks = set(_stem(w) for w in words)
+    # adjacent words glued together catch identifiers like "hometeam" or "fire_size"
+    grams = set(a + b for a, b in zip(words, words[1:])) | set(a + b + c for a, b, c in zip(words, words[1:], words[2:]))
+    return toks, grams | set(words)
+
+def sql_identifiers(sqls):
+    idents = set()
+    for sql in sqls or []:
+        for m in re.finditer(r'"([^"]+)"|`([^`]+)`|\[([^\]]+)\]|([A-Za-z_][A-Za-z0-9_]*)', sql or ""):
+            idents.add(next(g for g in m.groups() if g is not None).lower())
+    return idents
+
+class LinkedSchema:
+    __slots__ = ("text", "tables", "columns", "tokens", "full_tokens", "pruned")
+
+    def __init__(self, text, tables, columns, tokens, full_tokens, pruned):
+        self.text = text
+        self.tables = tables
+        self.columns = columns
+        self.tokens = tokens
+        self.full_tokens = full_tokens
+        self.pruned = pruned
+
+class SchemaLinker:
+    # ranks tables/columns by overlap with the NLQ, the SQL history and sampled values; pruning keeps join keys and bridge tables
+
+    def __init__(self, catalog, db_path=None, max_values=200, use_values=True):
+        self.catalog = catalog
+        self.db_path = db_path
+        self.max_values = max_values
+        self.use_values = use_values and db_path is not None
+        self._values = None
+        self._lock = threading.Lock()
+        self.full_text = render_schema(catalog)
+        self.tables = [t for t in catalog['tables'] if t['name'] != 'sqlite_sequence']
+        self._ttoks = {t['name']: identifier_tokens(t['name']) for t in self.tables}
+        self._ctoks = {(t['name'], c['name']): identifier_tokens(c['name']) for t in self.tables for c in t['columns']}
+
+    def _column_values(self):
+        # distinct text values per column, sampled once per linker
+        with self._lock:
+            if self._values is None:
+                values = {}
+                pool = get_sqlite_pool()
+                for t in self.tables:
+                    if not t.get('row_count'):
+                        continue
+                    for c in t['columns']:
+                        if 'CHAR' not in (c['type'] or '').upper() and 'TEXT' not in (c['type'] or '').upper() and c['type']:
+                            continue
+                        sql = f"SELECT DISTINCT {_quote_ident(c['name'])} FROM {_quote_ident(t['name'])} LIMIT {int(self.max_values)}"
+                        try:
+                            rows = pool.execute(self.db_path, sql, timeout=5)
+                        except Exception:
+                            continue
+                        vals = set(str(r[0]).lower() for r in rows if isinstance(r[0], str) and 3 <= len(r[0]) <= 64)
+                        if vals:
+                            values[(t['name'], c['name'])] = vals
+                self._values = values
+            return self._values
+
+    def score(self, nlq, sqls=()):
+        toks, grams = _text_tokens(nlq)
+        used = sql_identifiers(sqls)
+        nlq_l = (nlq or "").lower()
+        values = self._column_values() if self.use_values else {}
+        col_scores, table_scores = {}, {}
+        for t in self.tables:
+            tname = t['name']
+            best = 0.0
+            for c in t['columns']:
+                key = (tname, c['name'])
+                ct = self._ctoks[key]
+                s = len(ct & toks) / max(1, len(ct))
+                if c['name'].lower() in grams:
+                    s += 1.0
+                if c['name'].lower() in used:
+                    s += 3.0
+                vals = values.get(key)
+                if vals and any(re.search(r"\b" + re.escape(v) + r"\b", nlq_l) for v in vals):
+                    s += 1.5
+                col_scores[key] = s
+                best = max(best, s)
+            tt = self._ttoks[tname]
+            s = len(tt & toks) / max(1, len(tt)) + (1.0 if tname.lower() in grams else 0.0)
+            if tname.lower() in used:
+                s += 3.0
+            table_scores[tname] = s + 0.5 * best
+        return table_scores, col_scores
+
+    def _render_table(self, t, keep):
+        if len(keep) == len(t['columns']):
+            return t['sql']
+        parts = [f"{_quote_ident(c['name'])} {c['type']}".rstrip() for c in t['columns'] if c['name'] in keep]
+        pk = [c['name'] for c in sorted(t['columns'], key=lambda c: c['pk']) if c['pk'] and c['name'] in keep]
+        if pk:
+            parts.append("PRIMARY KEY (" + ", ".join(_quote_ident(n) for n in pk) + ")")
+        for fk in t['foreign_keys']:
+            if fk['from'] in keep:
+                parts.append(f"FOREIGN KEY ({_quote_ident(fk['from'])}) REFERENCES {_quote_ident(fk['table'])} ({_quote_ident(fk['to'] or '')})")
+        return f"CREATE TABLE {_quote_ident(t['name'])} (" + ", ".join(parts) + ")"
+
+    def _render(self, keep):
+        # tables and columns keep their catalog order
+        return "\n\n".join(self._render_table(t, keep[t['name']]) for t in self.tables if t['name'] in keep)
+
+    def _linked_tables(self, a, b):
+        ta = next(t for t in self.tables if t['name'] == a)
+        tb = next(t for t in self.tables if t['name'] == b)
+        return any(fk['table'].lower() == b.lower() for fk in ta['foreign_keys']) or any(fk['table'].lower() == a.lower() for fk in tb['foreign_keys'])
+
+    def _key_columns(self, t, kept_tables):
+        cols = set(c['name'] for c in t['columns'] if c['pk'])
+        for fk in t['foreign_keys']:
+            if fk['table'] in kept_tables:
+                cols.add(fk['from'])
+        for other in self.tables:
+            for fk in other['foreign_keys']:
+                if other['name'] in kept_tables and fk['table'].lower() == t['name'].lower() and fk['to']:
+                    cols.add(fk['to'])
+        return cols
+
+    def link(self, nlq, sqls=(), budget=1024, must=None):
+        # return a LinkedSchema within `budget` tokens; `must` ({table: columns}) is always kept
+        full_tokens = estimate_tokens(self.full_text)
+        all_tables = [t['name'] for t in self.tables]
+        if full_tokens <= budget:
+            cols = [(t['name'], c['name']) for t in self.tables for c in t['columns']]
+            return LinkedSchema(self.full_text, all_tables, cols, full_tokens, full_tokens, False)
+        table_scores, col_scores = self.score(nlq, sqls)
+        by_name = {t['name']: t for t in self.tables}
+        ranked = sorted(self.tables, key=lambda t: -table_scores[t['name']])
+        keep = {}
+        costs = {}
+
+        def table_cost(tname, cols):
+            # "\n\n" between statements is ~0.5 token; rounding up per table keeps the estimate safe
+            return estimate_tokens(self._render_table(by_name[tname], cols)) + 1
+
+        def try_add(tname, cols, force=False):
+            new = set(keep.get(tname, ())) | set(cols)
+            if tname in keep and new == keep[tname]:
+                return True
+            c = table_cost(tname, new)
+            if force or sum(costs.values()) - costs.get(tname, 0) + c <= budget:
+                keep[tname] = new
+                costs[tname] = c
+                return True
+            return False
+
+        for tname, cols in (must or {}).items():
+            if tname in by_name:
+                try_add(tname, [c for c in cols if any(x['name'] == c for x in by_name[tname]['columns'])], force=True)
+        # tables with any evidence, each with its positively scored columns
+        for t in ranked:
+            if table_scores[t['name']] <= 0 and keep:
+                break
+            cols = sorted((c['name'] for c in t['columns'] if col_scores[(t['name'], c['name'])] > 0), key=lambda n: -col_scores[(t['name'], n)])
+            if not try_add(t['name'], cols):
+                try_add(t['name'], cols[:1])
+        # foreign-key closure: bridge tables joining two kept tables, then join columns
+        names = list(keep)
+        for t in self.tables:
+            if t['name'] in keep:
+                continue
+            linked = [n for n in names if self._linked_tables(t['name'], n)]
+            if len(linked) >= 2 and not any(self._linked_tables(a, b) for a in linked for b in linked if a < b):
+                try_add(t['name'], [])
+        for t in self.tables:
+            if t['name'] in keep:
+                try_add(t['name'], self._key_columns(t, set(keep)))
+        # then a glimpse of every other table, best-ranked first, so no table silently vanishes
+        for t in ranked:
+            if t['name'] not in keep:
+                best = max(t['columns'], key=lambda c: col_scores[(t['name'], c['name'])], default=None)
+                try_add(t['name'], [best['name']] if best is not None else [])
+        # remaining budget goes to the best of the other columns of kept tables
+        rest = sorted(
+            ((col_scores[(t['name'], c['name'])], i, t['name'], c['name']) for i, t in enumerate(self.tables) if t['name'] in keep for c in t['columns'] if c['name'] not in keep[t['name']]),
+            key=lambda x: (-x[0], x[1]),
+        )
+        for _, _, tname, cname in rest:
+            try_add(tname, [cname])
+        text = self._render(keep)
+        cols = [(t['name'], c['name']) for t in self.tables if t['name'] in keep for c in t['columns'] if c['name'] in keep[t['name']]]
+        return LinkedSchema(text, [n for n in all_tables if n in keep], cols, estimate_tokens(text), full_tokens, True)
+
+    def recall(self, linked, table_refs, col_refs):
+        # fraction of the gold SQL's tables / schema columns that survived pruning; other refs are ignored
+        all_tables = {t['name'].lower() for t in self.tables}
+        all_cols = {c['name'].lower() for t in self.tables for c in t['columns']}
+        gold_tables = {t.lower() for t in table_refs} & all_tables
+        gold_cols = {c.lower() for c in col_refs} & all_cols
+        kept_tables = {t.lower() for t in linked.tables}
+        kept_cols = {c.lower() for _, c in linked.columns}
+        t_rec = len(gold_tables & kept_tables) / len(gold_tables) if gold_tables else 1.0
+        c_rec = len(gold_cols & kept_cols) / len(gold_cols) if gold_cols else 1.0
+        return t_rec, c_rec
+
+_linkers = {}
+_linkers_lock = threading.Lock()
+
+def get_schema_linker(db_name):
+    db_path = get_db_path(db_name)
+    if db_path is None:
+        return None
+    st = Path(db_path).stat()
+    key = (db_name, st.st_mtime_ns, st.st_size)
+    with _linkers_lock:
+        linker = _linkers.get(key)
+    if linker is None:
+        try:
+            max_values = int(os.getenv("SCHEMA_LINK_MAX_VALUES", "200"))
+        except Exception:
+            max_values = 200
+        linker = SchemaLinker(get_catalog(db_name), db_path=db_path, max_values=max_values, use_values=os.getenv("SCHEMA_LINK_VALUES", "1") == "1")
+        with _linkers_lock:
+            _linkers[key] = linker
+    return linker
+
+def schema_link_budget():
+    try:
+        return int(os.getenv("SCHEMA_LINK_BUDGET", "1024"))
+    except Exception:
+        return 1024
+
+class SchemaView:
+    # one sample's schema text: with SCHEMA_LINK=1 pruned against the NLQ and only grown when the
+    # SQL history uses something it left out, so the prompt prefix stays stable across rounds
+
+    def __init__(self, db_name, schema, nlq):
+        self.nlq = nlq
+        self.linker = get_schema_linker(db_name) if os.getenv("SCHEMA_LINK", "0") == "1" else None
+        self.budget = schema_link_budget()
+        self.linked = None
+        self.text = schema
+        if self.linker is not None:
+            self.linked = self.linker.link(nlq, budget=self.budget)
+            self.text = self.linked.text
+            if self.linked.pruned:
+                event("SchemaView.pruned", DEBUG, tokens=self.linked.tokens, full_tokens=self.linked.full_tokens, tables=len(self.linked.tables), columns=len(self.linked.columns))
+
+    def observe(self, sqls):
+        if self.linked is None or not self.linked.pruned:
+            return self.text
+        used = sql_identifiers(sqls)
+        kept = {t.lower() for t in self.linked.tables} | {c.lower() for _, c in self.linked.columns}
+        known = {t['name'].lower() for t in self.linker.tables} | {c['name'].lower() for t in self.linker.tables for c in t['columns']}
+        if (used & known) - kept:
+            must = {}
+            for tname, cname in self.linked.columns:
+                must.setdefault(tname, set()).add(cname)
+            for t in self.linker.tables:
+                cols = {c['name'] for c in t['columns'] if c['name'].lower() in used}
+                if t['name'].lower() in used or cols:
+                    must.setdefault(t['name'], set()).update(cols)
+            self.linked = self.linker.link(self.nlq, sqls=sqls, budget=self.budget, must=must)
+            self.text = self.linked.text
+        return self.text
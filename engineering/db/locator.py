@@ -1,9 +1,20 @@
+import os
 from .schema import generate_db_schema
+from .catalog import get_schema_catalog
 from ..io.paths import resolve_db_path
 
 db_schema_cache = {}
 
 def get_schema(db_name):
+    # the catalog revalidates against the file on every call, so an edited .sqlite is picked up
+    if os.getenv("SCHEMA_CATALOG", "1") == "1":
+        db_path = resolve_db_path(db_name)
+        if db_path is None:
+            return ""
+        try:
+            return get_schema_catalog().schema_text(db_path)
+        except Exception as e:
+            print(f"[ERROR] schema catalog failed for {db_name} ({e}); falling back to generate_db_schema")
     if db_name not in db_schema_cache:
         db_path = resolve_db_path(db_name)
         if db_path is not None:
@@ -12,7 +23,10 @@ def get_schema(db_name):
             db_schema_cache[db_name] = ""
     return db_schema_cache[db_name]
 
+def get_catalog(db_name):
+    db_path = resolve_db_path(db_name)
+    return get_schema_catalog().get(db_path) if db_path is not None else None
+
 def get_db_path(db_name):
     p = resolve_db_path(db_name)
     return str(p) if p is not None else None
-
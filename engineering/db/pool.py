@@ -0,0 +1,128 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import quote
+from .compare import digest_cursor
+
+class QueryTimeout(Exception):
+    pass
+
+class SQLitePool:
+    """Warm read-only SQLite connections per database file.
+
+    Connections are opened with mode=ro&immutable=1 and reused across evaluations; the
+    per-query time limit is enforced with a progress handler that interrupts the VM,
+    so no process has to be spawned or killed.
+    """
+
+    def __init__(self, max_idle_per_db=8, progress_steps=1000):
+        self.max_idle_per_db = max_idle_per_db
+        self.progress_steps = progress_steps
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _file_key(db_path):
+        p = Path(db_path).resolve()
+        st = p.stat()
+        # immutable connections never notice on-disk changes, so a rewritten file gets a fresh pool
+        return str(p), st.st_mtime_ns, st.st_size
+
+    def _pool_for(self, key):
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                for old in [k for k in self._pools if k[0] == key[0]]:
+                    self._close_pool(self._pools.pop(old))
+                pool = queue.LifoQueue()
+                self._pools[key] = pool
+            return pool
+
+    @staticmethod
+    def _close_pool(pool):
+        while True:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _connect(self, path):
+        uri = f"file:{quote(path)}?mode=ro&immutable=1"
+        return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    @contextmanager
+    def connection(self, db_path):
+        key = self._file_key(db_path)
+        pool = self._pool_for(key)
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect(key[0])
+        try:
+            yield conn
+        finally:
+            # a failed statement leaves a read-only connection usable, so it goes back either way
+            conn.set_progress_handler(None, 0)
+            if pool.qsize() < self.max_idle_per_db:
+                pool.put(conn)
+            else:
+                conn.close()
+
+    @contextmanager
+    def _deadline(self, conn, timeout):
+        deadline = time.monotonic() + timeout if timeout else None
+        if deadline is not None:
+            conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, self.progress_steps)
+        try:
+            yield
+        except sqlite3.OperationalError as e:
+            if deadline is not None and time.monotonic() > deadline and "interrupt" in str(e).lower():
+                raise QueryTimeout(f"Query timed out after {timeout}s")
+            raise
+
+    def execute(self, db_path, sql, timeout=30):
+        with self.connection(db_path) as conn, self._deadline(conn, timeout):
+            return conn.execute(sql).fetchall()
+
+    def preview(self, db_path, sql, timeout=30, max_rows=50):
+        # column names and the first rows only, for showing a result rather than comparing it
+        with self.connection(db_path) as conn, self._deadline(conn, timeout):
+            cursor = conn.execute(sql)
+            try:
+                return [c[0] for c in cursor.description or ()], cursor.fetchmany(max_rows)
+            finally:
+                cursor.close()
+
+    def digest(self, db_path, sql, timeout=30, chunk_size=1000, decimals=None, max_rows=None, max_bytes=None):
+        # stream the result through fetchmany into a ResultDigest instead of materializing it
+        with self.connection(db_path) as conn, self._deadline(conn, timeout):
+            cursor = conn.execute(sql)
+            try:
+                return digest_cursor(cursor, chunk_size=chunk_size, decimals=decimals, max_rows=max_rows, max_bytes=max_bytes)
+            finally:
+                cursor.close()
+
+    def close(self):
+        with self._lock:
+            for pool in self._pools.values():
+                self._close_pool(pool)
+            self._pools.clear()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_sqlite_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                try:
+                    max_idle = int(os.getenv("SQL_POOL_MAX_IDLE", "8"))
+                except Exception:
+                    max_idle = 8
+                _pool = SQLitePool(max_idle_per_db=max_idle)
+    return _pool
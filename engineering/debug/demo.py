@@ -4,35 +4,29 @@ import os
 import sqlite3
 from ..db.schema import generate_db_schema
 from ..utils.sanitize import clean_query
+from ..utils.tracing import DEBUG, enabled, span
+
+def _clip(v, n=500):
+    s = str(v)
+    return s[:n] + "..." if len(s) > n else s
 
 def debug_wrapper(func):
+    # inputs and outputs are only rendered when DEBUG tracing is on; otherwise this is a plain call
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        print(f"=== Calling {func.__name__} ===")
+        if not enabled(DEBUG):
+            return func(*args, **kwargs)
+        inputs = {}
         try:
-            sig = inspect.signature(func)
-            bound = sig.bind(*args, **kwargs)
+            bound = inspect.signature(func).bind(*args, **kwargs)
             bound.apply_defaults()
-            print("Inputs:")
-            for k, v in bound.arguments.items():
-                s = str(v)
-                if len(s) > 500:
-                    s = s[:500] + "..."
-                print(f" - {k}: {s}")
+            inputs = {f"in.{k}": _clip(v) for k, v in bound.arguments.items()}
         except Exception:
             pass
-        try:
+        with span(f"call {func.__name__}", DEBUG, **inputs) as sp:
             out = func(*args, **kwargs)
-            s = str(out)
-            if len(s) > 500:
-                s = s[:500] + "..."
-            print(f"Output: {s}")
+            sp.set(output=_clip(out))
             return out
-        except Exception as e:
-            print(f"Exception: {e}")
-            raise
-        finally:
-            print(f"=== End {func.__name__} ===")
     return wrapper
 
 def run_debug_demo():
@@ -0,0 +1,159 @@
+# a dialogue is a generator that yields the steps it needs (LLM call, SQL generation, evaluation,
+# shared stage) and gets each result back through send(), so one driver can run it on a thread and
+# another can interleave thousands of them on an event loop
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+from contextlib import contextmanager
+try:
+    from ..db.exec import evalfunc
+    from ..llm.speculative import agenerate_sql, generate_sql
+    from ..llm.telemetry import call_context
+except ImportError:
+    from engineering.db.exec import evalfunc
+    from engineering.llm.speculative import agenerate_sql, generate_sql
+    from engineering.llm.telemetry import call_context
+
+class Generate:
+    # one LLM call; the dialogue receives (text, cost_usd)
+    __slots__ = ("prompt", "model")
+
+    def __init__(self, prompt, model):
+        self.prompt = prompt
+        self.model = model
+
+class GenerateSQL:
+    # a SQL-producing LLM step (speculative when SPEC_CANDIDATES > 1); the dialogue receives the cleaned SQL
+    __slots__ = ("prompt", "model", "db_path")
+
+    def __init__(self, prompt, model, db_path):
+        self.prompt = prompt
+        self.model = model
+        self.db_path = db_path
+
+class Evaluate:
+    # compare `sql` with the gold query; the dialogue receives evalfunc's (is_correct, errors)
+    __slots__ = ("sql", "gold", "db_path")
+
+    def __init__(self, sql, gold, db_path):
+        self.sql = sql
+        self.gold = gold
+        self.db_path = db_path
+
+class Shared:
+    # a sub-dialogue from `make()`, run once per `key` while a StageStore is active; its calls go to section `shared:<name>`
+    __slots__ = ("key", "make", "name")
+
+    def __init__(self, key, make, name="stage"):
+        self.key = key
+        self.make = make
+        self.name = name
+
+class StageStore:
+    # single-flight results of Shared stages for one run
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def claim(self, key):
+        # return (future, owner); the owner must resolve the future, everyone else waits on it
+        with self._lock:
+            fut = self._entries.get(key)
+            if fut is not None:
+                self.hits += 1
+                return fut, False
+            fut = concurrent.futures.Future()
+            self._entries[key] = fut
+            self.misses += 1
+            return fut, True
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+_active_store = None
+
+@contextmanager
+def shared_stages(store=None):
+    # share Shared stages across every dialogue run (from any thread) inside the block
+    global _active_store
+    prev = _active_store
+    _active_store = store or StageStore()
+    try:
+        yield _active_store
+    finally:
+        _active_store = prev
+
+def _run_shared(step, run):
+    store = _active_store
+    if store is None:
+        return run(step.make())
+    fut, owner = store.claim(step.key)
+    if not owner:
+        return fut.result()
+    try:
+        with call_context(section=f"shared:{step.name}"):
+            out = run(step.make())
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    fut.set_result(out)
+    return out
+
+async def _arun_shared(step, run):
+    store = _active_store
+    if store is None:
+        return await run(step.make())
+    fut, owner = store.claim(step.key)
+    if not owner:
+        return await asyncio.wrap_future(fut)
+    try:
+        with call_context(section=f"shared:{step.name}"):
+            out = await run(step.make())
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    fut.set_result(out)
+    return out
+
+def run_dialogue(dialogue, generate, evaluate=None):
+    # drive `dialogue` to completion on the calling thread and return its result
+    # generate/evaluate come from the experiment module so patching them (debug/flow_demo.py) still works
+    evaluate = evaluate or evalfunc
+    reply = None
+    try:
+        while True:
+            step = dialogue.send(reply)
+            if type(step) is Generate:
+                reply = generate(step.prompt, model=step.model)
+            elif type(step) is GenerateSQL:
+                reply = generate_sql(step.prompt, step.model, step.db_path, generate)
+            elif type(step) is Shared:
+                reply = _run_shared(step, lambda sub: run_dialogue(sub, generate, evaluate))
+            else:
+                reply = evaluate(step.sql, step.gold, step.db_path)
+    except StopIteration as stop:
+        return stop.value
+
+async def arun_dialogue(dialogue, llm, executor=None, evaluate=None):
+    # drive `dialogue` on the running event loop; LLM steps go through `llm`, SQL runs in `executor`
+    evaluate = evaluate or evalfunc
+    loop = asyncio.get_running_loop()
+    reply = None
+    try:
+        while True:
+            step = dialogue.send(reply)
+            if type(step) is Generate:
+                reply = await llm.agenerate(step.prompt, model=step.model)
+            elif type(step) is GenerateSQL:
+                reply = await agenerate_sql(llm, step.prompt, step.model, step.db_path, executor)
+            elif type(step) is Shared:
+                reply = await _arun_shared(step, lambda sub: arun_dialogue(sub, llm, executor, evaluate))
+            else:
+                reply = await loop.run_in_executor(executor, contextvars.copy_context().run, evaluate, step.sql, step.gold, step.db_path)
+    except StopIteration as stop:
+        return stop.value
@@ -0,0 +1,203 @@
+# one dialogue engine for every method: the engine owns the sample lifecycle, a Method only decides what a round does
+import abc
+try:
+    from ..db.locator import get_schema, get_db_path
+    from ..db.linker import SchemaView
+    from ..llm.fewshot import get_few_shot_examples
+    from ..llm.prompt_builder import PromptBuilder
+    from ..llm.prompts import build_metadata_constraints
+    from ..llm.telemetry import set_round
+    from ..utils.sanitize import clean_query
+    from ..utils.tracing import DEBUG, event
+    from ..llm.speculative import spec_candidates
+    from .dialogue import Evaluate, Generate, GenerateSQL, Shared
+except ImportError:
+    from engineering.db.locator import get_schema, get_db_path
+    from engineering.db.linker import SchemaView
+    from engineering.llm.fewshot import get_few_shot_examples
+    from engineering.llm.prompt_builder import PromptBuilder
+    from engineering.llm.prompts import build_metadata_constraints
+    from engineering.llm.telemetry import set_round
+    from engineering.utils.sanitize import clean_query
+    from engineering.utils.tracing import DEBUG, event
+    from engineering.llm.speculative import spec_candidates
+    from engineering.experiments.dialogue import Evaluate, Generate, GenerateSQL, Shared
+
+class Sample:
+    # per-sample state shared by the stages of one dialogue
+
+    def __init__(self, idx, row, model, n_shots, vectorstore):
+        self.idx = idx
+        self.nlq = row['nl']
+        self.gold_sql = row['sql']
+        self.db_name = row['target_db'] if 'target_db' in row else row['db_id']
+        self.model = model
+        self.n_shots = n_shots
+        self.vectorstore = vectorstore
+        self.schema = None
+        self.db_path = None
+        self.meta = None
+        self.schema_view = None
+        self.prompts = None
+        self.sqls_history = []
+        self.cqas_history = []
+        # SQL -> ResultDigest (None when it failed) and SQL -> preview rows, so the divergence
+        # check runs each tried SQL once per sample instead of once per round
+        self.digests = {}
+        self.previews = {}
+        self.syntax_fix = False
+
+    def unique_sqls(self, sep=";\n"):
+        # distinct SQLs in first-seen order
+        return sep.join(sorted(list(set(self.sqls_history)), key=lambda x: self.sqls_history.index(x)))
+
+    def cqas(self, empty):
+        out = ""
+        for i in range(0, len(self.cqas_history), 2):
+            if i+1 < len(self.cqas_history):
+                out += f"multiple choice clarification question: {self.cqas_history[i]}\n"
+                out += f"user: {self.cqas_history[i+1]}\n"
+        return out or empty
+
+    def result(self, sql, rounds, is_correct, syntax_fix):
+        return {'id': self.idx, 'nlq': self.nlq, 'final_sql': sql, 'rounds': rounds, 'is_correct': is_correct, 'syntax_fix': syntax_fix}
+
+class Method(abc.ABC):
+    # strategy base class; subclasses set `name` and implement `round`
+
+    name = "M?"
+
+    def trace(self, kind, prompt):
+        event("prompt", DEBUG, method=self.name, kind=kind, text=prompt)
+
+    def retrieve(self, s):
+        # resolve the schema, database and few-shot examples; False when the sample cannot run
+        s.schema = get_schema(s.db_name)
+        s.db_path = get_db_path(s.db_name)
+        if not s.db_path:
+            return False
+        s.meta = build_metadata_constraints(s.nlq, s.schema)
+        examples_str = get_few_shot_examples(s.vectorstore, s.nlq, s.n_shots) if s.n_shots > 0 else ""
+        s.schema_view = SchemaView(s.db_name, s.schema, s.nlq)
+        s.prompts = PromptBuilder(s.schema_view.text, examples_str, label=f"{self.name}[{s.idx}] ")
+        return True
+
+    def initial(self, s, prompt):
+        return (yield GenerateSQL(prompt, s.model, s.db_path))
+
+    def first_stage(self, s, prompt):
+        # initial generation plus at most one syntax fix; returns (sql, is_correct, syntax_fix)
+        sql = yield from self.initial(s, prompt)
+        is_correct, errors = yield from self.evaluate(s, sql)
+        syntax_fix = False
+        if not is_correct and errors:
+            sql, is_correct, errors = yield from self.fix(s, sql, errors)
+            if is_correct:
+                syntax_fix = True
+        return sql, is_correct, syntax_fix
+
+    def first_stage_key(self, s, prompt):
+        # the stage depends only on these (the prompt already holds schema, constraints and
+        # few-shot examples), so methods that inherit it share one run per sample
+        return (type(self).first_stage, type(self).initial, type(self).fix, s.model, prompt, s.gold_sql, s.db_path, spec_candidates())
+
+    def evaluate(self, s, sql):
+        return (yield Evaluate(sql, s.gold_sql, s.db_path))
+
+    def fix(self, s, sql, errors):
+        # ask for an executable rewrite of `sql`; returns (fixed_sql, is_correct, errors)
+        prompt = s.prompts.fix_invalid(s.nlq, sql, str(errors[0]))
+        self.trace("fix_invalid", prompt)
+        fixed, _ = yield Generate(prompt, s.model)
+        fixed = clean_query(fixed)
+        is_correct, errors = yield from self.evaluate(s, fixed)
+        return fixed, is_correct, errors
+
+    def clarify(self, s, early_stop=False, divergence=""):
+        # raw reply of the SRA step
+        prompt = s.prompts.clarification(s.nlq, s.unique_sqls(), s.cqas("no previous clarification question.\n"), early_stop=early_stop, divergence=divergence)
+        self.trace("cq", prompt)
+        cq, _ = yield Generate(prompt, s.model)
+        return cq
+
+    def parse_cq(self, cq):
+        if "mul_choice_cq =" in cq:
+            cq = cq.split("mul_choice_cq =")[-1].strip().strip('"')
+        elif "mul_choice_cq=" in cq:
+            cq = cq.split("mul_choice_cq=")[-1].strip().strip('"')
+        elif len(cq.split('\n')) < 5:
+            pass
+        else:
+            lines = cq.strip().split('\n')
+            cq = lines[-1]
+        return cq
+
+    def simulate(self, s, cq):
+        # the simulated user's answer to `cq`, recorded in the sample's history
+        prompt = s.prompts.feedback(s.nlq, s.gold_sql, cq)
+        self.trace("feedback", prompt)
+        feedback, _ = yield Generate(prompt, s.model)
+        feedback = self.parse_answer(feedback)
+        event("answer", DEBUG, method=self.name, text=feedback)
+        s.cqas_history.append(cq)
+        s.cqas_history.append(feedback)
+        return feedback
+
+    def parse_answer(self, feedback):
+        if "answer_to_cq =" in feedback:
+            feedback = feedback.split("answer_to_cq =")[-1].strip().strip('"')
+        elif "answer_to_cq=" in feedback:
+            feedback = feedback.split("answer_to_cq=")[-1].strip().strip('"')
+        return feedback
+
+    def generate(self, s):
+        # sql_generation_v2 from the tried SQLs and the clarification dialogue so far
+        prompt = s.prompts.sql_generation(s.nlq, s.unique_sqls(), s.cqas("no previous clarification questions are asked.\n"), s.meta)
+        self.trace("sql_gen", prompt)
+        return (yield GenerateSQL(prompt, s.model, s.db_path))
+
+    @abc.abstractmethod
+    def round(self, s):
+        """One interaction round: return the next SQL to evaluate, or None to stop early."""
+
+def dialogue(method, idx, row, model, max_rounds, n_shots, vectorstore):
+    # the lifecycle every method shares, as a resumable dialogue
+    s = Sample(idx, row, model, n_shots, vectorstore)
+    if not method.retrieve(s):
+        return None
+    prompt = s.prompts.initial(s.nlq, s.meta)
+    method.trace("initial", prompt)
+    # identical across methods with the same shots, so with shared_stages() active it runs once per sample
+    sql, is_correct, s.syntax_fix = yield Shared(method.first_stage_key(s, prompt), lambda: method.first_stage(s, prompt), name="first_stage")
+    if is_correct:
+        return s.result(sql, 0, True, s.syntax_fix)
+    s.sqls_history.append(sql)
+    for round_i in range(max_rounds):
+        set_round(round_i + 1)
+        s.prompts.schema = s.schema_view.observe(s.sqls_history)
+        next_sql = yield from method.round(s)
+        if next_sql is None:
+            break
+        sql = next_sql
+        s.sqls_history.append(sql)
+        is_correct, errors = yield from method.evaluate(s, sql)
+        if not is_correct and errors:
+            # the fixed query replaces the failing one in the history
+            sql, is_correct, errors = yield from method.fix(s, sql, errors)
+            s.sqls_history[-1] = sql
+            if is_correct:
+                s.syntax_fix = True
+        if is_correct:
+            return s.result(sql, round_i+1, True, s.syntax_fix)
+    return s.result(sql, max_rounds, False, False)
+
+def run_experiment(sample_fn, samples, model, max_rounds, n_shots, vectorstore, name=None, max_workers=None):
+    # run one method over `samples` through the shared scheduler; returns a DataFrame in sample order
+    try:
+        from ..scheduler import pipeline_workers, run_sections
+    except ImportError:
+        from engineering.scheduler import pipeline_workers, run_sections
+    key = name or getattr(sample_fn, "__name__", "method")
+    workers = pipeline_workers() if max_workers is None else max_workers
+    frames = run_sections([(key, key, sample_fn, n_shots, vectorstore)], samples, model, max_rounds, max_workers=workers)
+    return frames[key]
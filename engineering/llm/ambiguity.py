@@ -0,0 +1,142 @@
+import concurrent.futures
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from ..io.paths import PROJECT_ROOT
+from .client import LLM_generation, llm_namespace
+from ..utils.tracing import event
+
+def build_ambiguity_batch_prompt(schema, nlqs):
+    questions = "\n".join(f"Q{i+1}: {q}" for i, q in enumerate(nlqs))
+    return (
+        "/* Given the following database schema: */\n" + schema + "\n" +
+        "/* And the following Natural Language Questions: */\n" + questions + "\n\n" +
+        "/* Task: For each question, determine if it is ambiguous given the schema.\n"
+        "   Ambiguity can arise from:\n"
+        "   - AmbQuestion: The question phrasing is unclear.\n"
+        "   - AmbTableColumn: Unclear mapping to tables/columns.\n"
+        "   - AmbOutput: Unclear what columns to output.\n"
+        "   - AmbValue: Unclear predicate values.\n\n"
+        "   Answer one line per question in the format \"Q<number>: Yes - <brief reason>\" if the question is ambiguous,\n"
+        "   or \"Q<number>: No - <brief reason>\" if it is clear.\n"
+        "*/\n"
+        "Are the questions ambiguous? Answers:\n"
+    )
+
+def parse_ambiguity_batch(text, n):
+    verdicts = [None] * n
+    for m in re.finditer(r"(?im)^\W*Q\s*(\d+)\s*[:.)\-]\s*(?:\*+\s*)?(yes|no)\b", text or ""):
+        i = int(m.group(1)) - 1
+        if 0 <= i < n and verdicts[i] is None:
+            verdicts[i] = m.group(2).lower() == "yes"
+    return verdicts
+
+class VerdictStore:
+    """Persisted ambiguity verdicts keyed by (llm_namespace(model), db_id, nlq)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "key TEXT PRIMARY KEY, model TEXT, db_id TEXT, nlq TEXT, ambiguous INTEGER, created_at REAL)"
+        )
+
+    @staticmethod
+    def make_key(model, db_id, nlq):
+        return hashlib.sha256(f"{model}\x00{db_id}\x00{nlq}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model, items):
+        keys = {self.make_key(model, db, nlq): (db, nlq) for db, nlq in items}
+        found = {}
+        key_list = list(keys)
+        with self._lock:
+            for i in range(0, len(key_list), 500):
+                chunk = key_list[i:i+500]
+                q = "SELECT key, ambiguous FROM verdicts WHERE key IN (%s)" % ",".join("?" * len(chunk))
+                for key, amb in self._conn.execute(q, chunk).fetchall():
+                    found[keys[key]] = bool(amb)
+        return found
+
+    def put_many(self, model, verdicts):
+        now = time.time()
+        rows = [(self.make_key(model, db, nlq), model, db, nlq, int(bool(v)), now) for (db, nlq), v in verdicts.items()]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO verdicts (key, model, db_id, nlq, ambiguous, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+def get_verdict_store():
+    path = os.getenv("AMBIGUITY_VERDICTS_PATH", str(PROJECT_ROOT / ".cache" / "ambiguity_verdicts.sqlite"))
+    try:
+        return VerdictStore(path)
+    except Exception as e:
+        print(f"[ERROR] ambiguity verdict store unavailable ({e})")
+        return None
+
+def classify_ambiguity(items, schemas, model, single_fn, batch_size=20, max_workers=4, store=None):
+    """Classify (db_id, nlq) pairs; returns {(db_id, nlq): bool}.
+
+    Known verdicts come from `store`. The rest are grouped by db_id so each prompt carries
+    the schema once with up to `batch_size` questions, and batches run concurrently.
+    Questions a batch answer does not cover fall back to `single_fn(nlq, schema, model)`.
+    Only verdicts parsed from a batch reply are persisted, keyed by the answering provider
+    (see llm_namespace); fallback verdicts, which an error or stub reply silently turns into
+    False, are returned for this run only.
+    """
+    items = list(dict.fromkeys(items))
+    ns = llm_namespace(model)
+    verdicts = store.get_many(ns, items) if store is not None else {}
+    todo = [it for it in items if it not in verdicts]
+    if not todo:
+        return verdicts
+    by_db = {}
+    for db, nlq in todo:
+        by_db.setdefault(db, []).append(nlq)
+    batches = []
+    for db, nlqs in by_db.items():
+        step = max(1, batch_size)
+        for i in range(0, len(nlqs), step):
+            batches.append((db, nlqs[i:i+step]))
+
+    def run_batch(db, nlqs):
+        # returns (parsed, fallback) verdict dicts
+        schema = schemas[db]
+        if batch_size <= 1:
+            # AMBIGUITY_BATCH_SIZE=1 keeps the original per-question prompt, whose verdict cannot be told from a stub
+            return {}, {(db, nlq): single_fn(nlq, schema, model) for nlq in nlqs}
+        # a lone tail question still goes through the batch prompt, so its verdict is parsed and persisted
+        prompt = build_ambiguity_batch_prompt(schema, nlqs)
+        resp, _ = LLM_generation(prompt, model=model, retries=3, retry_delay=1.5, log_each_retry=False)
+        parsed, fallback = {}, {}
+        for nlq, v in zip(nlqs, parse_ambiguity_batch(resp, len(nlqs))):
+            if v is not None:
+                parsed[(db, nlq)] = v
+            else:
+                fallback[(db, nlq)] = single_fn(nlq, schema, model)
+        return parsed, fallback
+
+    parsed, fallback = {}, {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [executor.submit(run_batch, db, nlqs) for db, nlqs in batches]
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                p, f = future.result()
+                parsed.update(p)
+                fallback.update(f)
+            except Exception as e:
+                print(f"[ERROR] classify_ambiguity batch failed: {e}")
+    if store is not None and parsed:
+        store.put_many(ns, parsed)
+    verdicts.update(parsed)
+    verdicts.update(fallback)
+    event("classify_ambiguity", items=len(items), cached=len(items) - len(todo), batches=len(batches), classified=len(parsed), fallback=len(fallback))
+    return verdicts
@@ -0,0 +1,128 @@
+import os
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+def _top_k(scores, k):
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < scores.shape[0]:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(scores.shape[0])
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+class FlatIndex:
+    """Exact inner-product search over unit-norm rows."""
+
+    kind = "flat"
+
+    def __init__(self, vecs):
+        self.vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+
+    def __len__(self):
+        return self.vecs.shape[0]
+
+    def search(self, q, k):
+        scores = self.vecs @ q
+        idx = _top_k(scores, k)
+        return idx, scores[idx]
+
+class IVFIndex:
+    """Inverted-file index: spherical k-means lists, probing the `nprobe` closest centroids."""
+
+    kind = "ivf"
+
+    def __init__(self, vecs, nlist=None, nprobe=8, iters=10, seed=0):
+        self.vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+        n = self.vecs.shape[0]
+        nlist = nlist or max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+        self.nprobe = max(1, min(nprobe, nlist))
+        rng = np.random.default_rng(seed)
+        centroids = self.vecs[rng.choice(n, nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = np.argmax(self.vecs @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, self.vecs)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # an empty list keeps its previous centroid
+            sums[empty] = centroids[empty]
+            norms[empty] = 1.0
+            centroids = sums / norms
+        self.centroids = centroids
+        assign = np.argmax(self.vecs @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(nlist + 1))
+        self.lists = [order[bounds[i]:bounds[i+1]] for i in range(nlist)]
+
+    def __len__(self):
+        return self.vecs.shape[0]
+
+    def search(self, q, k):
+        probe = _top_k(self.centroids @ q, self.nprobe)
+        cand = np.concatenate([self.lists[i] for i in probe])
+        if cand.shape[0] < k:
+            cand = np.arange(self.vecs.shape[0])
+        scores = self.vecs[cand] @ q
+        idx = _top_k(scores, k)
+        return cand[idx], scores[idx]
+
+class HNSWIndex:
+    """hnswlib graph index over unit-norm rows (inner-product space)."""
+
+    kind = "hnsw"
+
+    def __init__(self, vecs, m=16, ef_construction=200, ef=64):
+        vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+        self.n = vecs.shape[0]
+        self.ef = ef
+        self.index = hnswlib.Index(space="ip", dim=vecs.shape[1])
+        self.index.init_index(max_elements=self.n, ef_construction=ef_construction, M=m)
+        self.index.add_items(vecs, np.arange(self.n))
+        self.index.set_ef(ef)
+
+    def __len__(self):
+        return self.n
+
+    def search(self, q, k):
+        k = min(k, self.n)
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        self.index.set_ef(max(self.ef, k))
+        labels, dists = self.index.knn_query(q.reshape(1, -1).astype(np.float32), k=k)
+        return labels[0].astype(np.int64), 1.0 - dists[0]
+
+def build_index(vecs, kind=None):
+    """Build the index named by VECTOR_INDEX (auto|flat|ivf|hnsw) over unit-norm `vecs`.
+
+    auto keeps exact search for small banks, where a single matrix-vector product is
+    already well under a millisecond, and switches to HNSW (or IVF without hnswlib) above
+    VECTOR_INDEX_MIN_ANN rows.
+    """
+    kind = (kind or os.getenv("VECTOR_INDEX", "auto")).lower()
+    n = vecs.shape[0]
+    if kind == "auto":
+        try:
+            min_ann = int(os.getenv("VECTOR_INDEX_MIN_ANN", "20000"))
+        except Exception:
+            min_ann = 20000
+        if n < min_ann:
+            kind = "flat"
+        else:
+            kind = "hnsw" if hnswlib is not None else "ivf"
+    if n == 0:
+        kind = "flat"
+    if kind == "hnsw" and hnswlib is None:
+        print("[ERROR] VECTOR_INDEX=hnsw but hnswlib is not installed; using ivf")
+        kind = "ivf"
+    if kind == "hnsw":
+        return HNSWIndex(vecs, ef=int(os.getenv("VECTOR_HNSW_EF", "64")))
+    if kind == "ivf":
+        return IVFIndex(vecs, nprobe=int(os.getenv("VECTOR_IVF_NPROBE", "8")))
+    return FlatIndex(vecs)
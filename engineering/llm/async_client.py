@@ -0,0 +1,86 @@
+import asyncio
+import os
+from .client import _chat_request, _client_settings, _generation_steps
+from ..utils.tracing import span
+
+class AsyncLLMClient:
+    """asyncio counterpart of LLM_generation.
+
+    One AsyncOpenAI client (one pooled httpx session) is shared by every call and a
+    semaphore caps in-flight requests, so hundreds of samples can be driven from a
+    single event loop. Return values match LLM_generation: (text, cost_usd).
+    """
+
+    def __init__(self, max_concurrency=None, timeout=None):
+        if max_concurrency is None:
+            try:
+                max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "20"))
+            except Exception:
+                max_concurrency = 20
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self._client = None
+        self._sem = None
+
+    def _get_client(self):
+        if self._client is None:
+            from openai import AsyncOpenAI
+            api_key, base_url, timeout, max_retries = _client_settings()
+            if self.timeout is not None:
+                timeout = self.timeout
+            kwargs = {}
+            try:
+                import httpx
+                limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+                kwargs['http_client'] = httpx.AsyncClient(limits=limits, timeout=timeout)
+            except ImportError:
+                # fall back to the SDK's own pooled session; the semaphore still bounds in-flight calls
+                pass
+            self._client = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=max_retries, **kwargs)
+        return self._client
+
+    def _semaphore(self):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        return self._sem
+
+    async def agenerate(self, prompt, model='gpt-3.5-turbo', temperature=0.0, retries=3, retry_delay=1.5, log_each_retry=False, fallback_models=None):
+        with span("llm.call", model=model):
+            return await self._agenerate(prompt, model, temperature, retries, retry_delay, log_each_retry, fallback_models)
+
+    async def _agenerate(self, prompt, model, temperature, retries, retry_delay, log_each_retry, fallback_models):
+        # the same steps LLM_generation drives; only the sleeps and the transport are awaited here
+        steps = _generation_steps(prompt, model, temperature, retries, retry_delay, log_each_retry, fallback_models)
+        client = None
+        reply = None
+        try:
+            while True:
+                kind, arg = steps.send(reply)
+                reply = None
+                if kind == "connect":
+                    client = self._get_client()
+                elif kind == "sleep":
+                    await asyncio.sleep(arg)
+                else:
+                    try:
+                        async with self._semaphore():
+                            reply = await client.chat.completions.create(**_chat_request(prompt, arg, temperature))
+                    except Exception as e:
+                        reply = e
+        except StopIteration as stop:
+            return stop.value
+
+    async def agenerate_many(self, prompts, **kwargs):
+        # results come back in prompt order; concurrency is bounded by the semaphore
+        return await asyncio.gather(*[self.agenerate(p, **kwargs) for p in prompts])
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
@@ -0,0 +1,74 @@
+import math
+import re
+from collections import Counter
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+")
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or "").lower())
+
+class BM25Index:
+    """Inverted index with precomputed BM25 weights per posting.
+
+    A query only touches the postings of its own terms, so lookups cost
+    O(sum of posting lengths) instead of re-tokenizing the whole bank.
+    """
+
+    def __init__(self, texts, groups=None, k1=1.5, b=0.75):
+        self.n = len(texts)
+        lengths = np.zeros(self.n, dtype=np.float32)
+        postings = {}
+        for i, text in enumerate(texts):
+            tf = Counter(tokenize(text))
+            lengths[i] = sum(tf.values())
+            for term, c in tf.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(i)
+                postings[term][1].append(c)
+        avgdl = float(lengths.mean()) if self.n else 0.0
+        norm = k1 * (1.0 - b + b * lengths / avgdl) if avgdl > 0 else np.full(self.n, k1, dtype=np.float32)
+        self.postings = {}
+        for term, (ids, tfs) in postings.items():
+            ids = np.asarray(ids, dtype=np.int64)
+            tfs = np.asarray(tfs, dtype=np.float32)
+            df = ids.shape[0]
+            idf = math.log(1.0 + (self.n - df + 0.5) / (df + 0.5))
+            self.postings[term] = (ids, (idf * tfs * (k1 + 1.0) / (tfs + norm[ids])).astype(np.float32))
+        self.groups = {}
+        if groups is not None:
+            by_group = {}
+            for i, g in enumerate(groups):
+                by_group.setdefault(g, []).append(i)
+            self.groups = {g: np.asarray(ids, dtype=np.int64) for g, ids in by_group.items()}
+
+    def search(self, query, k, group=None):
+        """Return [(doc_index, score)] for the k best documents, best first.
+
+        Fewer than k positive scores are padded with zero-score documents in bank order, so
+        a query always gets k examples as it did from the token-overlap scorer.
+        """
+        if k <= 0 or self.n == 0:
+            return []
+        scores = np.zeros(self.n, dtype=np.float32)
+        for term in set(tokenize(query)):
+            p = self.postings.get(term)
+            if p is not None:
+                scores[p[0]] += p[1]
+        if group is not None:
+            members = self.groups.get(group)
+            if members is None:
+                return []
+        else:
+            members = np.arange(self.n)
+        cand = members[scores[members] > 0]
+        s = scores[cand]
+        if cand.shape[0] > k:
+            part = np.argpartition(-s, k - 1)[:k]
+            cand, s = cand[part], s[part]
+        # ties keep bank order, like the stable sort of the overlap scorer
+        order = np.lexsort((cand, -s))
+        hits = [(int(cand[i]), float(s[i])) for i in order]
+        if len(hits) < k:
+            hits.extend((int(i), 0.0) for i in np.sort(members[scores[members] <= 0])[:k - len(hits)])
+        return hits
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from ..io.paths import PROJECT_ROOT
+
+class ResponseCache:
+    """On-disk LLM completion cache keyed by sha256(llm_namespace(model), temperature, prompt).
+
+    Entries older than `ttl` seconds are dropped on read and during eviction;
+    when the table grows past `max_entries` the least recently used rows go first.
+    """
+
+    def __init__(self, path, max_entries=100000, ttl=0, evict_every=256):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, temperature REAL, response TEXT, "
+            "created_at REAL, accessed_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)")
+
+    @staticmethod
+    def make_key(namespace, temperature, prompt):
+        h = hashlib.sha256()
+        h.update(str(namespace).encode("utf-8"))
+        h.update(b"\x00")
+        h.update(repr(float(temperature)).encode("utf-8"))
+        h.update(b"\x00")
+        h.update(prompt.encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, namespace, temperature, prompt):
+        key = self.make_key(namespace, temperature, prompt)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM responses WHERE key=?", (key,)).fetchone()
+            if row is not None and self.ttl > 0 and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key=?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at=? WHERE key=?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, namespace, temperature, prompt, response):
+        key = self.make_key(namespace, temperature, prompt)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, temperature, response, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, str(namespace), float(temperature), response, now, now),
+            )
+            self._puts += 1
+            if self._puts % self.evict_every == 0:
+                self._evict_locked(now)
+
+    def evict(self):
+        with self._lock:
+            self._evict_locked(time.time())
+
+    def _evict_locked(self, now):
+        if self.ttl > 0:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        if self.max_entries > 0:
+            n = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if n > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                    (n - self.max_entries,),
+                )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            n = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                'path': str(self.path),
+                'entries': int(n),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / total) if total else 0.0,
+            }
+
+_cache = None
+_cache_failed = False
+_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Process-wide cache configured from LLM_CACHE* env vars; None when disabled."""
+    global _cache, _cache_failed
+    if os.getenv("LLM_CACHE", "1") != "1" or _cache_failed:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                path = os.getenv("LLM_CACHE_PATH", str(PROJECT_ROOT / ".cache" / "llm_cache.sqlite"))
+                try:
+                    max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "100000"))
+                except Exception:
+                    max_entries = 100000
+                try:
+                    ttl = float(os.getenv("LLM_CACHE_TTL", "0"))
+                except Exception:
+                    ttl = 0
+                try:
+                    _cache = ResponseCache(path, max_entries=max_entries, ttl=ttl)
+                except Exception as e:
+                    print(f"LLM warn: response cache unavailable ({e})")
+                    _cache_failed = True
+                    return None
+    return _cache
+
+def is_cacheable(temperature):
+    try:
+        max_temp = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0"))
+    except Exception:
+        max_temp = 0.0
+    return float(temperature) <= max_temp
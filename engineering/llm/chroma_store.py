@@ -0,0 +1,141 @@
+import os
+import sqlite3
+from pathlib import Path
+from urllib.parse import quote
+import numpy as np
+from .ann import _top_k
+from .embed_store import QueryVectorCache
+from ..utils.tracing import DEBUG, event
+
+# chroma's embeddings_queue operation codes
+_ADD, _UPDATE, _UPSERT, _DELETE = 0, 1, 2, 3
+
+class _ChromaDoc:
+    def __init__(self, metadata):
+        self.metadata = metadata
+
+class ChromaRetriever:
+    """Read-only few-shot retriever over chroma.sqlite3: exact cosine over embeddings_queue vectors, else BM25."""
+
+    def __init__(self, persist_dir, collection=None, embed_model=None):
+        self.persist_dir = Path(persist_dir)
+        self.embed_model = embed_model
+        uri = f"file:{quote(str((self.persist_dir / 'chroma.sqlite3').resolve()))}?mode=ro&immutable=1"
+        conn = sqlite3.connect(uri, uri=True)
+        try:
+            if collection:
+                row = conn.execute("SELECT id, name, dimension FROM collections WHERE name=?", (collection,)).fetchone()
+            else:
+                row = conn.execute("SELECT id, name, dimension FROM collections ORDER BY name LIMIT 1").fetchone()
+            if row is None:
+                raise ValueError(f"collection {collection!r} not found in {self.persist_dir}")
+            self.collection_id, self.collection, self.dim = row
+            segs = dict(conn.execute("SELECT scope, id FROM segments WHERE collection=?", (self.collection_id,)).fetchall())
+            self.pool = self._load_docs(conn, segs.get("METADATA"))
+            ids, vecs = self._load_vectors(conn)
+        finally:
+            conn.close()
+        pos = {d['id']: i for i, d in enumerate(self.pool)}
+        # rows of `vecs` that belong to live documents, and the document each row holds
+        keep = [(r, pos[i]) for r, i in enumerate(ids) if i in pos]
+        self._vec_rows = np.asarray([r for r, _ in keep], dtype=np.int64)
+        self._vec_docs = np.asarray([d for _, d in keep], dtype=np.int64)
+        self.vectors = vecs
+        self._norms = None
+        self._qvecs = QueryVectorCache(embed_model)
+        self.lexical = None
+        event("ChromaRetriever.load", dir=str(self.persist_dir), collection=self.collection, docs=len(self.pool), vectors=len(keep), dim=self.dim)
+
+    @staticmethod
+    def _load_docs(conn, metadata_segment):
+        docs = {}
+        q = (
+            "SELECT e.id, e.embedding_id, m.key, m.string_value FROM embeddings AS e "
+            "JOIN embedding_metadata AS m ON m.id = e.id WHERE e.segment_id = ? ORDER BY e.seq_id"
+        )
+        for rowid, emb_id, key, value in conn.execute(q, (metadata_segment,)):
+            d = docs.setdefault(rowid, {'id': emb_id})
+            if value is not None:
+                d[key] = value
+        pool = []
+        for d in docs.values():
+            nl = d.get('nl') or d.get('chroma:document') or ''
+            pool.append({'id': d['id'], 'nl': nl, 'gold': d.get('gold', ''), 'feedback': d.get('feedback', ''), 'db_id': d.get('db_id', '')})
+        return pool
+
+    def _load_vectors(self, conn):
+        # the HNSW segment files are not read: the bundled store never flushed into them, so
+        # the queue is the only source; the last add/update/upsert of an id wins, a delete drops it
+        pending = {}
+        for emb_id, op, blob, enc in conn.execute(
+            "SELECT id, operation, vector, encoding FROM embeddings_queue WHERE topic LIKE ? ORDER BY seq_id",
+            (f"%{self.collection_id}",),
+        ):
+            if op == _DELETE:
+                pending[emb_id] = None
+            elif blob is not None and (enc or "FLOAT32").upper() == "FLOAT32":
+                pending[emb_id] = blob
+        pending = {i: b for i, b in pending.items() if b is not None and len(b) == 4 * self.dim}
+        if not pending:
+            return [], np.zeros((0, self.dim), dtype=np.float32)
+        return list(pending), np.frombuffer(b"".join(pending.values()), dtype=np.float32).reshape(-1, self.dim)
+
+    def _can_embed(self):
+        # mock embeddings live in a different space than the stored vectors
+        from .client import embedding_namespace
+        return len(self._vec_rows) > 0 and not embedding_namespace(self.embed_model).startswith("mock-")
+
+    def prefetch_queries(self, queries):
+        if not self._can_embed():
+            return 0
+        return self._qvecs.prefetch(queries)
+
+    def _query_vector(self, query):
+        if not self._can_embed():
+            return None
+        qv = self._qvecs.get(query)
+        if qv is None or qv.shape[0] != self.dim:
+            return None
+        return qv
+
+    def _lexical_search(self, query, k, db_id):
+        if self.lexical is None:
+            from .bm25 import BM25Index
+            self.lexical = BM25Index([x['nl'] for x in self.pool], groups=[x['db_id'] for x in self.pool])
+        return [i for i, _ in self.lexical.search(query, k, group=db_id)]
+
+    def similarity_search(self, query, k=3, db_id=None):
+        if len(self.pool) == 0:
+            return []
+        q_norm = query.strip().lower()
+        # the user-study store carries no db_id, in which case the filter is a no-op
+        if db_id is not None and not any(x['db_id'] for x in self.pool):
+            db_id = None
+        qv = self._query_vector(query)
+        if qv is not None:
+            if self._norms is None:
+                norms = np.linalg.norm(self.vectors, axis=1)
+                norms[norms == 0] = 1.0
+                self._norms = norms
+            # scored over every queued row, then narrowed to the live documents
+            scores = ((self.vectors @ qv) / self._norms)[self._vec_rows]
+            if db_id is not None:
+                mask = np.asarray([self.pool[d]['db_id'] == db_id for d in self._vec_docs])
+                scores = np.where(mask, scores, -np.inf)
+            top = [int(self._vec_docs[i]) for i in _top_k(scores, k) if np.isfinite(scores[i])]
+            event("ChromaRetriever.similarity_search", DEBUG, top_idxs=top)
+        else:
+            top = self._lexical_search(query, k, db_id)
+            event("ChromaRetriever.similarity_search", DEBUG, bm25_top_idxs=top)
+        docs = []
+        for i in top:
+            x = self.pool[i]
+            if x['nl'].strip().lower() == q_norm:
+                continue
+            docs.append(_ChromaDoc({'nl': x['nl'], 'gold': x['gold'], 'feedback': x['feedback']}))
+        return docs
+
+def get_chroma_retriever(embed_model=None):
+    from ..io.paths import PROJECT_ROOT
+    persist_dir = os.getenv("CHROMA_PERSIST_DIR", str(PROJECT_ROOT / "userstudy_chroma"))
+    return ChromaRetriever(persist_dir, collection=os.getenv("CHROMA_COLLECTION") or None, embed_model=embed_model)
@@ -1,15 +1,47 @@
 import os
+import re
+import threading
 import time
+from .cache import get_response_cache, is_cacheable
+from .ratelimit import completion_token_budget, estimate_tokens, get_rate_limiter, rate_limit_retries, retry_after_seconds
+from .telemetry import record_call
+from ..utils.tracing import span
 
-def get_client():
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _client_settings():
     api_key = os.getenv("OPENAI_API_KEY")
     base_url = os.getenv("OPENAI_BASE_URL")
-    timeout = float(os.getenv("OPENAI_TIMEOUT", "30"))
-    from openai import OpenAI
-    return OpenAI(api_key=api_key, base_url=base_url if base_url else "https://api.openai.com/v1", timeout=timeout)
+    try:
+        timeout = float(os.getenv("OPENAI_TIMEOUT", "30"))
+    except Exception:
+        timeout = 30.0
+    # retries are handled by our own loops so every attempt passes through the shared rate limiter
+    try:
+        max_retries = int(os.getenv("OPENAI_MAX_RETRIES", "0"))
+    except Exception:
+        max_retries = 0
+    return api_key, base_url if base_url else "https://api.openai.com/v1", timeout, max_retries
+
+def get_client():
+    # one OpenAI client (and its HTTP connection pool) per settings tuple, shared by all threads
+    key = _client_settings()
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                from openai import OpenAI
+                api_key, base_url, timeout, max_retries = key
+                client = OpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=max_retries)
+                _clients[key] = client
+    return client
 
 def _classify_prompt(p):
     s = p.lower()
+    if "are the questions ambiguous? answers:" in s:
+        return "ambiguous_batch"
     if "is the question ambiguous? answer:" in s:
         return "ambiguous_check"
     if "fix the exception" in s or "inexecutable sql" in s or "invalid sql" in s:
@@ -26,13 +58,20 @@ def _classify_prompt(p):
         return "initial"
     return "other"
 
+def _mock_is_ambiguous(text):
+    s = text.lower()
+    keys = ["which", "or", "between", "and", "top", "most", "least", "maybe", "should"]
+    return sum(1 for k in keys if k in s) >= 2
+
 def _mock_llm_generation(prompt):
     tag = _classify_prompt(prompt)
+    if tag == "ambiguous_batch":
+        qs = re.findall(r"(?m)^Q(\d+): (.*)$", prompt)
+        return "\n".join(f"Q{i}: {'Yes - ambiguous' if _mock_is_ambiguous(q) else 'No - clear'}" for i, q in qs), 0.0
     if tag == "ambiguous_check":
-        s = prompt.lower()
-        keys = ["which", "or", "between", "and", "top", "most", "least", "maybe", "should"]
-        hits = sum(1 for k in keys if k in s)
-        if hits >= 2:
+        # judge the question alone, as the batch branch does; the instruction text would always match
+        m = re.search(r"Natural Language Question: \*/\n(.*?)\n\n/\* Task", prompt, re.S)
+        if _mock_is_ambiguous(m.group(1) if m else prompt):
             return "Yes: ambiguous", 0.0
         return "No: clear", 0.0
     if tag == "sra":
@@ -41,13 +80,26 @@ def _mock_llm_generation(prompt):
         return 'answer_to_cq = "a) COUNT(*)"', 0.0
     return "```sql\nSELECT 1\n```", 0.0
 
-def LLM_generation(prompt, model='gpt-3.5-turbo', temperature=0.0, retries=3, retry_delay=1.5, log_each_retry=False, fallback_models=None):
-    if os.getenv("LLM_MODE", "remote").lower() == "mock":
-        return _mock_llm_generation(prompt)
-    if not os.getenv("OPENAI_API_KEY"):
-        print("LLM warn: OPENAI_API_KEY missing, return stub")
-        return "```sql\nSELECT 1\n```", 0.0
-    client = get_client()
+def _error_label(e):
+    err_str = str(e)
+    l = err_str.lower()
+    if "502" in err_str or "bad gateway" in l:
+        return "502 Bad Gateway"
+    if "429" in err_str or "too many requests" in l or "rate limit" in l:
+        return "rate_limit"
+    if "timeout" in l or "timed out" in l:
+        return "timeout"
+    if "connection reset" in l or "reset by peer" in l:
+        return "conn_reset"
+    if "ssl" in l:
+        return "ssl_error"
+    if "unauthorized" in l or "401" in err_str:
+        return "unauthorized"
+    if "model" in l and "not found" in l:
+        return "model_not_found"
+    return "error"
+
+def _retry_settings(retries, retry_delay):
     # allow env overrides
     try:
         retries = int(os.getenv("LLM_RETRIES", str(retries)))
@@ -57,79 +109,156 @@ def LLM_generation(prompt, model='gpt-3.5-turbo', temperature=0.0, retries=3, re
         retry_delay = float(os.getenv("LLM_RETRY_DELAY", str(retry_delay)))
     except Exception:
         pass
-    llm_timeout = float(os.getenv("LLM_TIMEOUT", os.getenv("OPENAI_TIMEOUT", "30")))
-    last_err = None
+    return retries, retry_delay
+
+def _models_to_try(model, fallback_models):
     models_to_try = [model]
     if fallback_models is None:
         fallback_models = [os.getenv("AMBIGUITY_MODEL", "gpt-4o-mini"), "gpt-4o"]
     for m in fallback_models:
         if m not in models_to_try:
             models_to_try.append(m)
-    for try_model in models_to_try:
-        for attempt in range(retries):
+    return models_to_try
+
+def _usage_tokens(response, prompt, content):
+    # providers that omit usage are estimated the same way the rate limiter budgets
+    usage = getattr(response, "usage", None)
+    pt = getattr(usage, "prompt_tokens", None)
+    ct = getattr(usage, "completion_tokens", None)
+    if pt is None or ct is None:
+        return estimate_tokens(prompt), estimate_tokens(content), True
+    return pt, ct, False
+
+def _local_reply(tag, prompt, model, text, started):
+    # mock and stub replies are recorded with estimated tokens and no cost
+    record_call(tag, model, estimate_tokens(prompt), estimate_tokens(text), started, estimated=True)
+    return text, 0.0
+
+def LLM_generation(prompt, model='gpt-3.5-turbo', temperature=0.0, retries=3, retry_delay=1.5, log_each_retry=False, fallback_models=None):
+    """Return (text, cost_usd). Every call is recorded in the telemetry metrics sink and traced as a span."""
+    with span("llm.call", model=model):
+        return _generate(prompt, model, temperature, retries, retry_delay, log_each_retry, fallback_models)
+
+def _generate(prompt, model, temperature, retries, retry_delay, log_each_retry, fallback_models):
+    steps = _generation_steps(prompt, model, temperature, retries, retry_delay, log_each_retry, fallback_models)
+    client = None
+    reply = None
+    try:
+        while True:
+            kind, arg = steps.send(reply)
+            reply = None
+            if kind == "connect":
+                client = get_client()
+            elif kind == "sleep":
+                time.sleep(arg)
+            else:
+                try:
+                    reply = client.chat.completions.create(**_chat_request(prompt, arg, temperature))
+                except Exception as e:
+                    reply = e
+    except StopIteration as stop:
+        return stop.value
+
+def _chat_request(prompt, model, temperature):
+    return {'model': model, 'messages': [{"role": "user", "content": prompt}], 'temperature': temperature, 'max_tokens': 4096}
+
+def _generation_steps(prompt, model, temperature, retries, retry_delay, log_each_retry, fallback_models):
+    # everything LLM_generation and AsyncLLMClient do around the transport: mock/stub replies, the
+    # response cache, model fallback, retries, rate limiting and telemetry. Yields ("connect", None)
+    # once before the first request, then ("sleep", seconds) and ("call", model); a call step
+    # receives the response or the exception it raised.
+    started = time.perf_counter()
+    tag = _classify_prompt(prompt)
+    if os.getenv("LLM_MODE", "remote").lower() == "mock":
+        return _local_reply(tag, prompt, model, _mock_llm_generation(prompt)[0], started)
+    if not os.getenv("OPENAI_API_KEY"):
+        print("LLM warn: OPENAI_API_KEY missing, return stub")
+        return _local_reply(tag, prompt, model, "```sql\nSELECT 1\n```", started)
+    cache = get_response_cache() if is_cacheable(temperature) else None
+    if cache is not None:
+        cached = cache.get(llm_namespace(model), temperature, prompt)
+        if cached is not None:
+            record_call(tag, model, 0, 0, started, cached=True)
+            return cached, 0.0
+    # the client is built before the first reservation, so its setup never counts as request time
+    yield ("connect", None)
+    retries, retry_delay = _retry_settings(retries, retry_delay)
+    limiter = get_rate_limiter()
+    est_tokens = estimate_tokens(prompt) + completion_token_budget()
+    last_err = None
+    failed = 0
+    for try_model in _models_to_try(model, fallback_models):
+        attempt = 0
+        rl_hits = 0
+        while attempt < retries:
+            if limiter is not None:
+                wait = limiter.reserve(est_tokens)
+                if wait > 0:
+                    yield ("sleep", wait)
+            response = yield ("call", try_model)
             try:
-                response = client.chat.completions.create(
-                    model=try_model,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=temperature,
-                    max_tokens=4096
-                )
-                return response.choices[0].message.content.strip(), 0.0
+                if isinstance(response, Exception):
+                    raise response
+                if limiter is not None:
+                    limiter.on_success()
+                    usage = getattr(response, "usage", None)
+                    limiter.settle(est_tokens, getattr(usage, "total_tokens", None))
+                content = response.choices[0].message.content.strip()
+                if cache is not None and try_model == model:
+                    cache.put(llm_namespace(model), temperature, prompt, content)
+                pt, ct, estimated = _usage_tokens(response, prompt, content)
+                cost = record_call(tag, model, pt, ct, started, retries=failed,
+                                   fallback_model=try_model if try_model != model else None, estimated=estimated)
+                return content, cost
             except Exception as e:
                 last_err = e
-                err_str = str(e)
-                l = err_str.lower()
-                if "502" in err_str or "bad gateway" in l:
-                    err_label = "502 Bad Gateway"
-                elif "429" in err_str or "too many requests" in l or "rate limit" in l:
-                    err_label = "rate_limit"
-                elif "timeout" in l or "timed out" in l:
-                    err_label = "timeout"
-                elif "connection reset" in l or "reset by peer" in l:
-                    err_label = "conn_reset"
-                elif "ssl" in l:
-                    err_label = "ssl_error"
-                elif "unauthorized" in l or "401" in err_str:
-                    err_label = "unauthorized"
-                elif "model" in l and "not found" in l:
-                    err_label = "model_not_found"
-                else:
-                    err_label = "error"
+                failed += 1
+                err_label = _error_label(e)
+                if err_label == "rate_limit" and limiter is not None and rl_hits < rate_limit_retries():
+                    # back off through the shared limiter instead of a private sleep
+                    rl_hits += 1
+                    limiter.on_rate_limit(retry_after_seconds(e))
+                    if log_each_retry:
+                        print(f"LLM error ({err_label}), throttled {rl_hits}/{rate_limit_retries()}")
+                    continue
                 if log_each_retry:
                     print(f"LLM error ({err_label}), retry {attempt+1}/{retries}")
-                time.sleep(retry_delay * (1.5 ** attempt))
+                yield ("sleep", retry_delay * (1.5 ** attempt))
+                attempt += 1
     if last_err is not None:
-        err_str = str(last_err)
-        l = err_str.lower()
-        if "502" in err_str or "bad gateway" in l:
-            err_label = "502 Bad Gateway"
-        elif "429" in err_str or "too many requests" in l or "rate limit" in l:
-            err_label = "rate_limit"
-        elif "timeout" in l or "timed out" in l:
-            err_label = "timeout"
-        elif "connection reset" in l or "reset by peer" in l:
-            err_label = "conn_reset"
-        elif "ssl" in l:
-            err_label = "ssl_error"
-        elif "unauthorized" in l or "401" in err_str:
-            err_label = "unauthorized"
-        elif "model" in l and "not found" in l:
-            err_label = "model_not_found"
-        else:
-            err_label = "error"
-        print(f"LLM error ({err_label}); giving up")
+        print(f"LLM error ({_error_label(last_err)}); giving up")
+    record_call(tag, model, 0, 0, started, retries=failed, ok=False)
     return "SELECT * FROM error", 0.0
 
-def _mock_embed_texts(texts):
-    import re
-    try:
-        dim = int(os.getenv("EMBED_DIM", "128"))
-    except Exception:
-        dim = 128
+def _mock_embed_enabled():
+    return os.getenv("EMBED_MODE", "remote").lower() == "mock" or not os.getenv("OPENAI_API_KEY")
+
+def llm_namespace(model):
+    # identifies who actually answers LLM_generation, so persisted verdicts never mix mock, stub and real replies
+    if os.getenv("LLM_MODE", "remote").lower() == "mock":
+        return f"mock:{model}"
+    if not os.getenv("OPENAI_API_KEY"):
+        return f"stub:{model}"
+    return f"{_client_settings()[1]}:{model}"
+
+def embedding_namespace(model=None):
+    # identifies which vector space embed_texts returns, so persisted vectors never mix models
+    if _mock_embed_enabled():
+        return f"mock-{os.getenv('EMBED_DIM', '128')}"
+    return model or os.getenv("EMBED_MODEL", "text-embedding-ada-002")
+
+def _mock_embed_texts(texts, dim=None):
+    import zlib
+    if dim is None:
+        try:
+            dim = int(os.getenv("EMBED_DIM", "128"))
+        except Exception:
+            dim = 128
     def one(t):
         v = [0.0] * dim
         for tok in re.findall(r"\w+", (t or "").lower()):
-            idx = (hash(tok) & 0xffffffff) % dim
+            # crc32 rather than hash() so mock vectors are stable across processes
+            idx = zlib.crc32(tok.encode("utf-8")) % dim
             v[idx] += 1.0
         norm = sum(x*x for x in v) ** 0.5
         if norm > 0:
@@ -138,7 +267,7 @@ def _mock_embed_texts(texts):
     return [one(t) for t in texts]
 
 def embed_texts(texts, model=None, retries=3, retry_delay=1.5, log_each_retry=False):
-    if os.getenv("EMBED_MODE", "remote").lower() == "mock" or not os.getenv("OPENAI_API_KEY"):
+    if _mock_embed_enabled():
         return _mock_embed_texts(texts)
     client = get_client()
     try:
@@ -149,19 +278,36 @@ def embed_texts(texts, model=None, retries=3, retry_delay=1.5, log_each_retry=Fa
         retry_delay = float(os.getenv("EMBED_RETRY_DELAY", str(retry_delay)))
     except Exception:
         pass
-    embed_timeout = float(os.getenv("EMBED_TIMEOUT", os.getenv("OPENAI_TIMEOUT", "30")))
+    try:
+        embed_timeout = float(os.getenv("EMBED_TIMEOUT", os.getenv("OPENAI_TIMEOUT", "30")))
+    except Exception:
+        embed_timeout = 30.0
     m = model or os.getenv("EMBED_MODEL", "text-embedding-ada-002")
+    limiter = get_rate_limiter()
+    est_tokens = sum(estimate_tokens(t) for t in texts)
     last_err = None
-    for attempt in range(retries):
+    attempt = 0
+    rl_hits = 0
+    while attempt < retries:
+        if limiter is not None:
+            limiter.acquire(est_tokens)
         try:
-            resp = client.embeddings.create(model=m, input=texts)
+            resp = client.embeddings.create(model=m, input=texts, timeout=embed_timeout)
+            if limiter is not None:
+                limiter.on_success()
+                usage = getattr(resp, "usage", None)
+                limiter.settle(est_tokens, getattr(usage, "total_tokens", None))
             return [d.embedding for d in resp.data]
         except Exception as e:
             last_err = e
+            if _error_label(e) == "rate_limit" and limiter is not None and rl_hits < rate_limit_retries():
+                rl_hits += 1
+                limiter.on_rate_limit(retry_after_seconds(e))
+                continue
             if log_each_retry:
                 print(f"Embedding error, retry {attempt+1}/{retries}: {e}")
-            import time
             time.sleep(retry_delay * (1.5 ** attempt))
+            attempt += 1
     if last_err is not None:
         print(f"Embedding error; giving up: {last_err}")
     return []
@@ -0,0 +1,209 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+from ..io.paths import PROJECT_ROOT
+from ..utils.tracing import WARN, event
+
+def normalize_rows(vecs):
+    vecs = np.asarray(vecs, dtype=np.float32)
+    if vecs.ndim == 1:
+        vecs = vecs.reshape(1, -1)
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vecs / norms
+
+class EmbeddingStore:
+    """Unit-norm float32 embeddings persisted in a memory-mapped file, keyed by text hash.
+
+    `vectors.f32` holds the rows back to back; `keys.sqlite` maps sha256(text) to a row.
+    Writers append under a sqlite write lock, so several processes can share one store.
+    """
+
+    def __init__(self, root, namespace):
+        self.root = Path(root) / re.sub(r"[^A-Za-z0-9._-]+", "_", namespace)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.vec_path = self.root / "vectors.f32"
+        self.vec_path.touch(exist_ok=True)
+        self.dim = None
+        self._mm = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.root / "keys.sqlite"), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS keys (hash TEXT PRIMARY KEY, row INTEGER)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        row = self._conn.execute("SELECT value FROM meta WHERE name='dim'").fetchone()
+        if row is not None:
+            self.dim = int(row[0])
+
+    @staticmethod
+    def text_key(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _matrix(self):
+        # remap only when another writer (or we) appended rows
+        n = self.vec_path.stat().st_size // (4 * self.dim)
+        if self._mm is None or self._mm.shape[0] != n:
+            self._mm = np.memmap(self.vec_path, dtype=np.float32, mode="r", shape=(n, self.dim)) if n else np.zeros((0, self.dim), dtype=np.float32)
+        return self._mm
+
+    def lookup(self, texts):
+        """Return {text: row} for the texts already stored."""
+        keys = {self.text_key(t): t for t in texts}
+        found = {}
+        key_list = list(keys)
+        with self._lock:
+            for i in range(0, len(key_list), 500):
+                chunk = key_list[i:i+500]
+                q = "SELECT hash, row FROM keys WHERE hash IN (%s)" % ",".join("?" * len(chunk))
+                for h, r in self._conn.execute(q, chunk).fetchall():
+                    found[keys[h]] = r
+        return found
+
+    def add(self, texts, vecs):
+        vecs = normalize_rows(vecs)
+        if len(texts) != vecs.shape[0]:
+            raise ValueError("texts and vectors differ in length")
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self.dim is None:
+                    row = self._conn.execute("SELECT value FROM meta WHERE name='dim'").fetchone()
+                    self.dim = int(row[0]) if row is not None else vecs.shape[1]
+                    self._conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('dim', ?)", (str(self.dim),))
+                if vecs.shape[1] != self.dim:
+                    raise ValueError(f"embedding dim {vecs.shape[1]} does not match store dim {self.dim}")
+                start = self.vec_path.stat().st_size // (4 * self.dim)
+                with open(self.vec_path, "r+b") as f:
+                    # a torn tail from a crashed writer is overwritten rather than kept misaligned
+                    f.seek(start * 4 * self.dim)
+                    f.write(vecs.tobytes())
+                    f.flush()
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO keys (hash, row) VALUES (?, ?)",
+                    [(self.text_key(t), start + i) for i, t in enumerate(texts)],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def vectors(self, rows):
+        with self._lock:
+            return np.array(self._matrix()[np.asarray(rows, dtype=np.int64)], dtype=np.float32)
+
+    def embed(self, texts, embed_fn, batch_size=64, progress=None):
+        """Return an (n, dim) unit-norm matrix for `texts`, embedding only unseen ones.
+
+        `embed_fn(list_of_texts)` returns a list of vectors, or an empty list on failure,
+        in which case None is returned and nothing partial is stored for that batch.
+        """
+        unique = list(dict.fromkeys(texts))
+        rows = self.lookup(unique)
+        todo = [t for t in unique if t not in rows]
+        for i in range(0, len(todo), max(1, batch_size)):
+            chunk = todo[i:i+batch_size]
+            v = embed_fn(chunk)
+            if not v or len(v) != len(chunk):
+                return None
+            self.add(chunk, v)
+            if progress is not None:
+                progress(i + len(chunk), len(todo))
+        if todo:
+            rows = self.lookup(unique)
+        if not texts:
+            return np.zeros((0, self.dim or 1), dtype=np.float32)
+        return self.vectors([rows[t] for t in texts])
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM keys").fetchone()[0]
+
+class QueryVectorCache:
+    """In-process LRU of unit-norm query vectors, backed by the persistent embedding store.
+
+    prefetch() embeds many queries in batches; get() serves from the LRU and only falls
+    back to embedding (as a batch of one) on a miss.
+    """
+
+    def __init__(self, embed_model=None, max_entries=None):
+        self.embed_model = embed_model
+        if max_entries is None:
+            try:
+                max_entries = int(os.getenv("QUERY_VEC_CACHE_SIZE", "4096"))
+            except Exception:
+                max_entries = 4096
+        self.max_entries = max_entries
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, texts, vecs):
+        with self._lock:
+            for t, v in zip(texts, vecs):
+                self._mem[t] = v
+                self._mem.move_to_end(t)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+
+    def prefetch(self, queries):
+        from .client import embed_texts, embedding_namespace
+        with self._lock:
+            todo = [q for q in dict.fromkeys(queries) if q not in self._mem]
+        if not todo:
+            return 0
+        try:
+            batch = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+        except Exception:
+            batch = 64
+        embed_fn = lambda chunk: embed_texts(chunk, model=self.embed_model)
+        store = get_embedding_store(embedding_namespace(self.embed_model))
+        if store is not None:
+            vecs = store.embed(todo, embed_fn, batch_size=batch)
+        else:
+            vecs = []
+            for i in range(0, len(todo), batch):
+                v = embed_fn(todo[i:i+batch])
+                if not v:
+                    vecs = None
+                    break
+                vecs.extend(v)
+            vecs = normalize_rows(vecs) if vecs else None
+        if vecs is None:
+            event("QueryVectorCache.prefetch", WARN, status="failed", queries=len(todo))
+            return 0
+        self._remember(todo, vecs)
+        event("QueryVectorCache.prefetch", queries=len(todo), store='yes' if store is not None else 'no')
+        return len(todo)
+
+    def get(self, query):
+        with self._lock:
+            v = self._mem.get(query)
+            if v is not None:
+                self._mem.move_to_end(query)
+                return v
+        self.prefetch([query])
+        with self._lock:
+            return self._mem.get(query)
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_embedding_store(namespace):
+    if os.getenv("EMBED_STORE", "1") != "1":
+        return None
+    root = os.getenv("EMBED_STORE_DIR", str(PROJECT_ROOT / ".cache" / "embeddings"))
+    key = (root, namespace)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            try:
+                store = EmbeddingStore(root, namespace)
+            except Exception as e:
+                print(f"[ERROR] embedding store unavailable ({e}); embedding in memory only")
+                return None
+            _stores[key] = store
+    return store
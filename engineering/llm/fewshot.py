@@ -1,8 +1,14 @@
-def get_few_shot_examples(vectorstore, target_nlq, n_shots=3):
+def _search(vectorstore, target_nlq, n_shots, db_id):
+    # db_id is only passed when set, so stores without the parameter keep working
+    if db_id is None:
+        return vectorstore.similarity_search(target_nlq, k=n_shots)
+    return vectorstore.similarity_search(target_nlq, k=n_shots, db_id=db_id)
+
+def get_few_shot_examples(vectorstore, target_nlq, n_shots=3, db_id=None):
     if not vectorstore or n_shots <= 0:
         return ""
     try:
-        docs = vectorstore.similarity_search(target_nlq, k=n_shots)
+        docs = _search(vectorstore, target_nlq, n_shots, db_id)
         examples = []
         for doc in docs:
             nl = doc.metadata.get('nl', '')
@@ -16,11 +22,11 @@ def get_few_shot_examples(vectorstore, target_nlq, n_shots=3):
         print(f"Error retrieving examples: {e}")
         return ""
 
-def get_feedback_few_shot_examples(vectorstore, target_nlq, n_shots=3):
+def get_feedback_few_shot_examples(vectorstore, target_nlq, n_shots=3, db_id=None):
     if not vectorstore or n_shots <= 0:
         return ""
     try:
-        docs = vectorstore.similarity_search(target_nlq, k=n_shots)
+        docs = _search(vectorstore, target_nlq, n_shots, db_id)
         examples = []
         for doc in docs:
             nl = doc.metadata.get('nl', '')
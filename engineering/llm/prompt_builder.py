@@ -0,0 +1,153 @@
+import os
+from .prompts import (
+    SRA, SRA_ES, sql_generation_v2, fix_invalid_v1, sql_generation_selfdebug, feedback_v2,
+    cq_prefix_v1, feedback_prefix_v1, fewshot_prefix,
+)
+from .ratelimit import estimate_tokens
+from ..utils.tracing import event
+
+_INITIAL_INSTRUCTION = "Complete sqlite SQL query only and with no explanation.\n"
+_OUTPUT_SQL = "/* Output ONLY SQL wrapped in a markdown block: ```sql */\n"
+
+def _static_tail(template):
+    # the instruction block every template ends with, after its last placeholder section
+    return template[template.index("\n\n/*", template.rindex("}")) + 2:]
+
+# prefix layout: the fixed instructions and few-shot blocks of each task come first, then
+# the schema, then whatever changes from call to call
+_SRA_TAIL = _static_tail(SRA)
+_SRA_ES_TAIL = _static_tail(SRA_ES)
+_FEEDBACK_TAIL = _static_tail(feedback_v2)
+_FIX_TAIL = "/* Fix the exception and write a new executable SQL query with no explanation */\n" + _OUTPUT_SQL
+
+class PromptParts:
+    __slots__ = ("kind", "prefix", "suffix")
+
+    def __init__(self, kind, prefix, suffix):
+        self.kind = kind
+        self.prefix = prefix
+        self.suffix = suffix
+
+    @property
+    def text(self):
+        return self.prefix + self.suffix
+
+def prompt_layout():
+    # PROMPT_LAYOUT=prefix opts in; the default reproduces the original prompts byte for byte
+    v = os.getenv("PROMPT_LAYOUT", "legacy").lower()
+    return "prefix" if v == "prefix" else "legacy"
+
+def _common_prefix_len(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    # compare in blocks first; prompts share long prefixes
+    step = 256
+    while i + step <= n and a[i:i+step] == b[i:i+step]:
+        i += step
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+class PromptBuilder:
+    """Assembles the M1/M2/M3 prompts for one sample.
+
+    In the legacy layout every method returns exactly the string the experiments used
+    to concatenate. In the prefix layout stable content (instructions, fixed few-shot
+    blocks, schema, retrieved examples) forms a common prefix and only the suffix varies
+    across rounds, so provider prompt caching and vLLM prefix caching can reuse it.
+    Each call records how much of the prompt it shares with the previous one of its kind.
+    """
+
+    def __init__(self, schema, examples="", layout=None, label=""):
+        self.schema = schema
+        self.examples = examples or ""
+        self.layout = layout or prompt_layout()
+        self.label = label
+        self.calls = []
+        self._last = {}
+
+    def _emit(self, kind, prefix, suffix):
+        parts = PromptParts(kind, prefix, suffix)
+        text = parts.text
+        prev = self._last.get(kind)
+        shared = _common_prefix_len(prev, text) if prev is not None else 0
+        self._last[kind] = text
+        rec = {
+            'kind': kind, 'layout': self.layout, 'chars': len(text), 'prefix_chars': len(prefix),
+            'shared_chars': shared, 'shared_tokens': estimate_tokens(text[:shared]) if shared else 0,
+        }
+        self.calls.append(rec)
+        if os.getenv("PROMPT_PREFIX_TRACE", "0") == "1":
+            event("prompt.layout", label=self.label.strip(), kind=kind, layout=self.layout, chars=rec['chars'], prefix=rec['prefix_chars'], shared=shared)
+        return text
+
+    def _schema_block(self):
+        return f"/* Given the following database schema: */\n{self.schema}\n"
+
+    def initial(self, nlq, meta):
+        examples = self.examples
+        if self.layout == "legacy":
+            return self._emit("initial", "", (
+                _INITIAL_INSTRUCTION +
+                f"{examples}/* Given the following database schema: */\n{self.schema}\n{meta}\n/* Answer the following with no explanation: {nlq} */"
+            ))
+        prefix = _INITIAL_INSTRUCTION + f"{meta}\n" + self._schema_block() + examples
+        return self._emit("initial", prefix, f"/* Answer the following with no explanation: {nlq} */")
+
+    def fix_invalid(self, nlq, invalid_sql, ex):
+        if self.layout == "legacy":
+            return self._emit("fix_invalid", "", fix_invalid_v1.format(schema=self.schema, question=nlq, invalidSQL=invalid_sql, ex=ex))
+        suffix = f"/* And the following inexecutable sql query */\n{invalid_sql}\n/* And the following exception message */\n{ex}\n"
+        return self._emit("fix_invalid", _FIX_TAIL + self._schema_block(), suffix)
+
+    def clarification(self, nlq, sqls, cqs, early_stop=False, divergence=""):
+        template = SRA_ES if early_stop else SRA
+        if divergence:
+            # how the listed answers' results differ, so the question can target that difference
+            sqls = sqls + "\n" + divergence
+        if self.layout == "legacy":
+            return self._emit("cq", "", cq_prefix_v1 + template.format(schema=self.schema, question=nlq, sqls=sqls, cqs=cqs))
+        tail = _SRA_ES_TAIL if early_stop else _SRA_TAIL
+        suffix = (
+            "/* Ask the user a new multiple choice clarification question to help you find the correct SQL answer for the following question: */\n"
+            f"{nlq}\n/* And the following incorrect sql answers: */\n{sqls}\n"
+            f"/* And the following previous clarification questions and user replies: */\n{cqs}\n"
+        )
+        return self._emit("cq", cq_prefix_v1 + tail + self._schema_block(), suffix)
+
+    def feedback(self, nlq, gold_sql, cq):
+        if self.layout == "legacy":
+            return self._emit("feedback", "", feedback_prefix_v1 + feedback_v2.format(nlq=nlq, query=gold_sql, question=cq))
+        # no schema here; nlq and gold query are fixed for the sample, only the question moves
+        prefix = feedback_prefix_v1 + _FEEDBACK_TAIL + f"/* Given the following Natural Language Question: */\n{nlq}\n/* And the following Gold Query: */\n{gold_sql}\n"
+        suffix = f"/* Answer the following multiple choice clarification question truthfully based on the Gold Query: */\n{cq}\n"
+        return self._emit("feedback", prefix, suffix)
+
+    def sql_generation(self, nlq, sqls, cqas, meta):
+        if self.layout == "legacy":
+            return self._emit("sql_gen", "", sql_generation_v2.format(schema=self.schema, question=nlq, sqls=sqls, cqas=cqas, metadata=meta))
+        prefix = _OUTPUT_SQL + f"{meta}\n" + self._schema_block()
+        suffix = (
+            f"/* And the following incorrect sql answers: */\n{sqls}\n"
+            f"/* And the following user replies to help you write the correct sql query: */\n{cqas}\n"
+            f"/* Answer the following with no explanation: {nlq} */\n"
+        )
+        return self._emit("sql_gen", prefix, suffix)
+
+    def selfdebug(self, nlq, sqls, selfdebug_shots=None):
+        examples = self.examples
+        shots = fewshot_prefix + selfdebug_shots if selfdebug_shots is not None else ""
+        if self.layout == "legacy":
+            return self._emit("selfdebug", "", examples + shots + sql_generation_selfdebug.format(schema=self.schema, sqls=sqls, question=nlq, metadata=""))
+        prefix = shots + _OUTPUT_SQL + self._schema_block() + examples
+        suffix = f"/* And the following incorrect sql answers: */\n{sqls}\n/* Answer the following with no explanation: {nlq} */\n"
+        return self._emit("selfdebug", prefix, suffix)
+
+    def stats(self):
+        out = {}
+        for rec in self.calls:
+            s = out.setdefault(rec['kind'], {'calls': 0, 'chars': 0, 'shared_chars': 0})
+            s['calls'] += 1
+            s['chars'] += rec['chars']
+            s['shared_chars'] += rec['shared_chars']
+        return out
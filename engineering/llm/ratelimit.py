@@ -0,0 +1,188 @@
+import asyncio
+import collections
+import email.utils
+import os
+import threading
+import time
+
+def estimate_tokens(text):
+    # ~4 characters per token is close enough for budgeting; usage reports settle the difference
+    return len(text or "") // 4 + 1
+
+def retry_after_seconds(err):
+    resp = getattr(err, "response", None)
+    headers = getattr(resp, "headers", None)
+    if not headers:
+        return None
+    try:
+        ms = headers.get("retry-after-ms")
+        if ms:
+            return max(0.0, float(ms) / 1000.0)
+    except Exception:
+        pass
+    val = headers.get("retry-after")
+    if not val:
+        return None
+    try:
+        return max(0.0, float(val))
+    except Exception:
+        pass
+    try:
+        dt = email.utils.parsedate_to_datetime(val)
+        return max(0.0, dt.timestamp() - time.time())
+    except Exception:
+        return None
+
+class _Bucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.updated = time.monotonic()
+
+    def reserve(self, amount, now, factor):
+        # take `amount` now (possibly going into debt) and return how long the caller must wait
+        rate = self.rate * factor
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        self.tokens -= min(amount, self.capacity)
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / rate
+
+class RateLimiter:
+    """Process-wide requests/tokens-per-minute limiter with AIMD adaptation.
+
+    Callers reserve capacity before each request and sleep for the returned delay, so
+    concurrent workers are spread out instead of firing in lockstep. A rate-limit error
+    halves the effective rate and pauses everyone until Retry-After has elapsed; each
+    success adds back a small fraction of the configured rate.
+
+    Without LLM_RPM/LLM_TPM there is no configured rate to scale, so the request rate seen
+    over the last `window` seconds when the first 429 arrives is taken as the ceiling and,
+    while the factor is below 1, requests are spaced at least 1 / (ceiling * factor) apart.
+    """
+
+    def __init__(self, rpm=0, tpm=0, increase=0.05, decrease=0.5, min_factor=0.05, cooldown=1.0, window=60.0):
+        self.requests = _Bucket(rpm) if rpm and rpm > 0 else None
+        self.tokens = _Bucket(tpm) if tpm and tpm > 0 else None
+        self.increase = increase
+        self.decrease = decrease
+        self.min_factor = min_factor
+        self.cooldown = cooldown
+        self.factor = 1.0
+        self.paused_until = 0.0
+        self.rate_limited = 0
+        self._streak = 0
+        self.window = window
+        # request start times, only kept when there is no request bucket to adapt
+        self._starts = collections.deque(maxlen=4096)
+        self._observed_rate = None
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        # the delay the caller must wait before sending; acquire/aacquire sleep it for you
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self.paused_until - now)
+            if self.requests is not None:
+                wait = max(wait, self.requests.reserve(1, now, self.factor))
+            if self.tokens is not None:
+                wait = max(wait, self.tokens.reserve(tokens, now, self.factor))
+            if self.requests is None:
+                wait = max(wait, self._space(now, wait))
+            return wait
+
+    def _space(self, now, wait):
+        # minimum inter-request gap from the observed throughput; caller holds the lock
+        start = now + wait
+        if self._observed_rate is not None and self.factor < 1.0:
+            start = max(start, self._next_start)
+            self._next_start = start + 1.0 / (self._observed_rate * self.factor)
+        self._starts.append(start)
+        return start - now
+
+    def _measure(self, now):
+        # requests per second over the recent window, None until there are two to compare
+        while self._starts and self._starts[0] < now - self.window:
+            self._starts.popleft()
+        if len(self._starts) < 2:
+            return None
+        span = max(now, self._starts[-1]) - self._starts[0]
+        return (len(self._starts) - 1) / span if span > 0 else None
+
+    def acquire(self, tokens=1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens=1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated, actual):
+        # correct the token bucket once the real usage is known
+        if self.tokens is None or actual is None:
+            return
+        with self._lock:
+            self.tokens.tokens -= (actual - estimated)
+
+    def on_success(self):
+        with self._lock:
+            self._streak = 0
+            self.factor = min(1.0, self.factor + self.increase)
+            if self.factor >= 1.0:
+                # fully recovered: stop spacing and measure afresh at the next 429
+                self._observed_rate = None
+
+    def on_rate_limit(self, retry_after=None):
+        with self._lock:
+            self.rate_limited += 1
+            self._streak += 1
+            self.factor = max(self.min_factor, self.factor * self.decrease)
+            if self.requests is None and self._observed_rate is None:
+                self._observed_rate = self._measure(time.monotonic())
+            if retry_after is None:
+                retry_after = self.cooldown * (2 ** min(self._streak - 1, 6))
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def stats(self):
+        with self._lock:
+            return {'factor': self.factor, 'rate_limited': self.rate_limited, 'paused_for': max(0.0, self.paused_until - time.monotonic()),
+                    'observed_rps': self._observed_rate}
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_rate_limiter():
+    """Shared limiter for LLM_generation, AsyncLLMClient and embed_texts; None when LLM_RATE_LIMIT=0."""
+    global _limiter
+    if os.getenv("LLM_RATE_LIMIT", "1") != "1":
+        return None
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                try:
+                    rpm = float(os.getenv("LLM_RPM", "0"))
+                except Exception:
+                    rpm = 0
+                try:
+                    tpm = float(os.getenv("LLM_TPM", "0"))
+                except Exception:
+                    tpm = 0
+                _limiter = RateLimiter(rpm=rpm, tpm=tpm)
+    return _limiter
+
+def rate_limit_retries():
+    try:
+        return int(os.getenv("LLM_RATE_LIMIT_RETRIES", "8"))
+    except Exception:
+        return 8
+
+def completion_token_budget():
+    try:
+        return int(os.getenv("LLM_RATE_COMPLETION_TOKENS", "512"))
+    except Exception:
+        return 512
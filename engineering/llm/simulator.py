@@ -0,0 +1,312 @@
+# offline OpenAI-compatible stand-in for load and regression runs (see docs/run_commands.md);
+# delays and injected failures are seeded by the prompt and its repeat count, so reruns match
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from pathlib import Path
+from .cache import ResponseCache
+from .client import _mock_embed_texts, _mock_llm_generation
+from .ratelimit import estimate_tokens
+
+class LatencyModel:
+    # spec is "fixed:S", "uniform:LO,HI", "normal:MEAN,SD" or "lognormal:MEDIAN,SIGMA" (seconds), plus decode time per token
+
+    def __init__(self, spec="fixed:0", tokens_per_s=0.0):
+        kind, _, args = (spec or "fixed:0").partition(":")
+        self.kind = kind.strip().lower()
+        self.args = [float(a) for a in args.split(",") if a.strip()] or [0.0]
+        if self.kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"unknown latency distribution {kind!r}")
+        self.tokens_per_s = tokens_per_s
+        self.spec = spec
+
+    def sample(self, rng, completion_tokens=0):
+        a = self.args
+        if self.kind == "uniform":
+            base = rng.uniform(a[0], a[1] if len(a) > 1 else a[0])
+        elif self.kind == "normal":
+            base = rng.gauss(a[0], a[1] if len(a) > 1 else 0.0)
+        elif self.kind == "lognormal":
+            base = a[0] * math.exp(rng.gauss(0.0, a[1] if len(a) > 1 else 0.0))
+        else:
+            base = a[0]
+        decode = completion_tokens / self.tokens_per_s if self.tokens_per_s > 0 else 0.0
+        return max(0.0, base) + decode
+
+class _Window:
+    # fixed one-minute window, which is how the upstream limits are reported back
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.start = time.monotonic()
+
+    def take(self, amount, now):
+        if now - self.start >= 60.0:
+            self.start = now
+            self.used = 0
+        if self.used + amount > self.limit:
+            return self.start + 60.0 - now
+        self.used += amount
+        return 0.0
+
+class TranscriptStore:
+    # prompt -> recorded reply from JSONL transcripts and/or a response cache written from `cache_namespace` (a base URL)
+
+    def __init__(self, paths=(), cache_path=None, cache_namespace="https://api.openai.com/v1"):
+        self.replies = {}
+        for p in paths:
+            self._load_jsonl(Path(p))
+        self.cache_namespace = cache_namespace
+        self.cache = None
+        if cache_path and Path(cache_path).exists():
+            self.cache = ResponseCache(cache_path)
+
+    @staticmethod
+    def _key(prompt, model=None):
+        return hashlib.sha256(f"{model or ''}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def _load_jsonl(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except Exception:
+                    continue
+                prompt = rec.get('prompt')
+                if prompt is None and rec.get('messages'):
+                    prompt = prompt_of(rec['messages'])
+                reply = rec.get('response', rec.get('content', rec.get('completion')))
+                if prompt is None or reply is None:
+                    continue
+                # keyed with and without the model, so a replay under another model still hits
+                self.replies[self._key(prompt, rec.get('model'))] = reply
+                self.replies.setdefault(self._key(prompt), reply)
+
+    def lookup(self, model, temperature, prompt):
+        reply = self.replies.get(self._key(prompt, model)) or self.replies.get(self._key(prompt))
+        if reply is None and self.cache is not None:
+            reply = self.cache.get(f"{self.cache_namespace}:{model}", temperature, prompt)
+        return reply
+
+    def __len__(self):
+        return len(self.replies)
+
+def prompt_of(messages):
+    return "\n".join(str(m.get('content', '')) for m in messages if isinstance(m, dict))
+
+class SimConfig:
+    def __init__(self, seed=0, latency="fixed:0", tokens_per_s=0.0, error_rate=0.0, rate_429=0.0,
+                 rpm=0, tpm=0, transcripts=(), cache_path=None, embed_dim=None, time_scale=1.0,
+                 cache_namespace="https://api.openai.com/v1"):
+        self.seed = seed
+        self.latency = LatencyModel(latency, tokens_per_s)
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.rpm = rpm
+        self.tpm = tpm
+        self.transcripts = list(transcripts)
+        self.cache_path = cache_path
+        self.cache_namespace = cache_namespace
+        self.embed_dim = embed_dim
+        self.time_scale = time_scale
+
+    @classmethod
+    def from_env(cls):
+        def num(name, default, cast=float):
+            try:
+                return cast(os.getenv(name, str(default)))
+            except Exception:
+                return default
+        paths = [p for p in os.getenv("SIM_TRANSCRIPTS", "").split(os.pathsep) if p]
+        return cls(
+            seed=num("SIM_SEED", 0, int), latency=os.getenv("SIM_LATENCY", "fixed:0"),
+            tokens_per_s=num("SIM_TOKENS_PER_S", 0.0), error_rate=num("SIM_ERROR_RATE", 0.0),
+            rate_429=num("SIM_429_RATE", 0.0), rpm=num("SIM_RPM", 0, int), tpm=num("SIM_TPM", 0, int),
+            transcripts=paths, cache_path=os.getenv("SIM_REPLAY_CACHE") or None,
+            embed_dim=num("SIM_EMBED_DIM", 0, int) or None, time_scale=num("SIM_TIME_SCALE", 1.0),
+            cache_namespace=os.getenv("SIM_REPLAY_NAMESPACE", "https://api.openai.com/v1"),
+        )
+
+class Simulator:
+    # decides, for one request, the reply, the delay and whether it fails
+
+    def __init__(self, config):
+        self.config = config
+        self.transcripts = TranscriptStore(config.transcripts, config.cache_path, config.cache_namespace)
+        self._rpm = _Window(config.rpm) if config.rpm > 0 else None
+        self._tpm = _Window(config.tpm) if config.tpm > 0 else None
+        self._seen = {}
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'replayed': 0, 'mocked': 0, 'rate_limited': 0, 'injected_429': 0,
+                      'injected_errors': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+
+    def _rng(self, model, prompt):
+        # the n-th ask of a prompt always draws the same numbers, whatever the interleaving
+        h = hashlib.sha256(f"{model}\x00{prompt}".encode("utf-8")).hexdigest()
+        with self._lock:
+            n = self._seen.get(h, 0)
+            self._seen[h] = n + 1
+        return random.Random(f"{self.config.seed}:{h}:{n}")
+
+    def _count(self, **inc):
+        with self._lock:
+            for k, v in inc.items():
+                self.stats[k] += v
+
+    def _limit(self, tokens):
+        if self._rpm is None and self._tpm is None:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            wait = self._rpm.take(1, now) if self._rpm is not None else 0.0
+            if not wait and self._tpm is not None:
+                wait = self._tpm.take(tokens, now)
+                if wait and self._rpm is not None:
+                    self._rpm.used -= 1
+        return wait
+
+    def chat(self, body):
+        # return (status, headers, payload, delay_seconds) for a chat.completions request
+        model = body.get('model', 'sim')
+        prompt = prompt_of(body.get('messages') or [])
+        temperature = float(body.get('temperature', 1.0))
+        self._count(requests=1)
+        rng = self._rng(model, prompt)
+        scale = self.config.time_scale
+        prompt_tokens = estimate_tokens(prompt)
+        wait = self._limit(prompt_tokens + int(body.get('max_tokens') or 0))
+        if wait:
+            self._count(rate_limited=1)
+            return 429, _retry_headers(wait * scale), _error("rate_limit_exceeded", "Rate limit reached (simulated)"), 0.0
+        if rng.random() < self.config.rate_429:
+            self._count(injected_429=1)
+            wait = rng.uniform(0.5, 2.0)
+            return 429, _retry_headers(wait * scale), _error("rate_limit_exceeded", "Too Many Requests (injected)"), 0.0
+        if rng.random() < self.config.error_rate:
+            self._count(injected_errors=1)
+            status = rng.choice((500, 502, 503))
+            delay = self.config.latency.sample(rng) * scale
+            reason = {500: "Internal Server Error", 502: "Bad Gateway", 503: "Service Unavailable"}[status]
+            return status, {}, _error("server_error", f"{status} {reason} (injected)"), delay
+        reply = self.transcripts.lookup(model, temperature, prompt)
+        if reply is None:
+            reply = _mock_llm_generation(prompt)[0]
+            self._count(mocked=1)
+        else:
+            self._count(replayed=1)
+        completion_tokens = estimate_tokens(reply)
+        self._count(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        delay = self.config.latency.sample(rng, completion_tokens) * scale
+        payload = {
+            'id': f"chatcmpl-sim-{uuid.uuid4().hex[:24]}", 'object': 'chat.completion', 'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': reply}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens},
+        }
+        return 200, {}, payload, delay
+
+    def embeddings(self, body):
+        inputs = body.get('input')
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        inputs = [str(x) for x in inputs or []]
+        self._count(requests=1)
+        dim = self.config.embed_dim or int(body.get('dimensions') or 0) or 1536
+        # the mock embedder's vectors are stable across runs and processes
+        vecs = _mock_embed_texts(inputs, dim=dim)
+        tokens = sum(estimate_tokens(t) for t in inputs)
+        self._count(prompt_tokens=tokens)
+        rng = self._rng(body.get('model', 'sim-embed'), "\x00".join(inputs))
+        return 200, {}, {
+            'object': 'list', 'model': body.get('model', 'sim-embed'),
+            'data': [{'object': 'embedding', 'index': i, 'embedding': list(map(float, v))} for i, v in enumerate(vecs)],
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+        }, self.config.latency.sample(rng) * self.config.time_scale
+
+def _retry_headers(wait):
+    return {'retry-after': f"{max(wait, 0.001):.3f}", 'retry-after-ms': str(int(max(wait, 0.001) * 1000))}
+
+def _error(code, message):
+    return {'error': {'message': message, 'type': code, 'code': code}}
+
+def create_app(config=None):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+
+    sim = Simulator(config or SimConfig.from_env())
+    app = FastAPI(title="OpenAI-compatible simulator")
+    app.state.sim = sim
+
+    async def respond(status, headers, payload, delay):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return JSONResponse(payload, status_code=status, headers=headers)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        return await respond(*sim.chat(await request.json()))
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        return await respond(*sim.embeddings(await request.json()))
+
+    @app.get("/v1/models")
+    async def models():
+        return {'object': 'list', 'data': [{'id': 'sim', 'object': 'model', 'owned_by': 'simulator'}]}
+
+    @app.get("/sim/stats")
+    async def stats():
+        with sim._lock:
+            out = dict(sim.stats)
+        out['transcripts'] = len(sim.transcripts)
+        out['latency'] = sim.config.latency.spec
+        return out
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline OpenAI-compatible LLM simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8008)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--latency", default=None, help='e.g. "fixed:0.2", "uniform:0.1,0.8", "lognormal:0.6,0.4"')
+    parser.add_argument("--tokens-per-s", type=float, default=None, help="decode speed; adds completion_tokens / rate")
+    parser.add_argument("--error-rate", type=float, default=None, help="fraction of requests answered 500/502/503")
+    parser.add_argument("--rate-429", type=float, default=None, help="fraction of requests answered 429")
+    parser.add_argument("--rpm", type=int, default=None, help="requests per minute before 429 (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=None, help="tokens per minute before 429 (0 = unlimited)")
+    parser.add_argument("--transcripts", action="append", default=None, help="JSONL transcript to replay (repeatable)")
+    parser.add_argument("--replay-cache", default=None, help="LLM response cache sqlite to replay from")
+    parser.add_argument("--replay-namespace", default=None, help="OPENAI_BASE_URL of the run that wrote --replay-cache")
+    parser.add_argument("--time-scale", type=float, default=None, help="multiply every delay (0 = no sleeping)")
+    args = parser.parse_args()
+    cfg = SimConfig.from_env()
+    if args.seed is not None:
+        cfg.seed = args.seed
+    if args.latency is not None or args.tokens_per_s is not None:
+        cfg.latency = LatencyModel(args.latency or cfg.latency.spec, args.tokens_per_s if args.tokens_per_s is not None else cfg.latency.tokens_per_s)
+    for name in ("error_rate", "rate_429", "rpm", "tpm", "time_scale"):
+        if getattr(args, name) is not None:
+            setattr(cfg, name, getattr(args, name))
+    if args.transcripts:
+        cfg.transcripts = args.transcripts
+    if args.replay_cache:
+        cfg.cache_path = args.replay_cache
+    if args.replay_namespace:
+        cfg.cache_namespace = args.replay_namespace
+    import uvicorn
+    uvicorn.run(create_app(cfg), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
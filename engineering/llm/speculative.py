@@ -0,0 +1,103 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import os
+from ..db.divergence import cluster_by_result
+from ..utils.sanitize import clean_query
+from ..utils.tracing import event
+from .client import LLM_generation
+
+def spec_candidates():
+    # SPEC_CANDIDATES=1 (default) keeps the single greedy generation
+    try:
+        return max(1, int(os.getenv("SPEC_CANDIDATES", "1")))
+    except Exception:
+        return 1
+
+def spec_temperature():
+    try:
+        return float(os.getenv("SPEC_TEMPERATURE", "0.7"))
+    except Exception:
+        return 0.7
+
+def spec_agreement():
+    # below this share of candidates in the winning cluster the question is treated as ambiguous
+    try:
+        return float(os.getenv("SPEC_AGREEMENT", "0.6"))
+    except Exception:
+        return 0.6
+
+class Vote:
+    """Outcome of one speculative step.
+
+    `clusters` lists candidate indices grouped by result fingerprint, largest first;
+    candidates that failed to execute are left out and counted in `failed`.
+    """
+
+    def __init__(self, sqls, clusters, failed, cost):
+        self.sqls = sqls
+        self.clusters = clusters
+        self.failed = failed
+        self.cost = cost
+
+    @property
+    def sql(self):
+        # the majority cluster's earliest member, so a tie goes to the greedy candidate
+        return self.sqls[self.clusters[0][0]] if self.clusters else self.sqls[0]
+
+    @property
+    def agreement(self):
+        return len(self.clusters[0]) / len(self.sqls) if self.clusters else 0.0
+
+    @property
+    def needs_clarification(self):
+        return len(self.clusters) != 1 or self.agreement < spec_agreement()
+
+    def alternatives(self):
+        """One SQL per losing cluster, i.e. the competing readings of the question."""
+        return [self.sqls[c[0]] for c in self.clusters[1:]]
+
+def speculate(prompt, model, db_path, n=None, generate=None):
+    """Sample `n` candidates for `prompt` concurrently and vote on their execution results.
+
+    Candidate 0 is the usual greedy (temperature 0) generation and the rest are sampled at
+    SPEC_TEMPERATURE. `generate` defaults to LLM_generation; callers pass their own module
+    binding so patched generators keep working.
+    """
+    n = n or spec_candidates()
+    generate = generate or LLM_generation
+    temperature = spec_temperature()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=n) as ex:
+        # each task runs in a copy of the caller's context, so telemetry and traces stay attributed to the sample
+        futures = [ex.submit(contextvars.copy_context().run, generate, prompt, model=model, temperature=0.0 if i == 0 else temperature)
+                   for i in range(n)]
+        replies = [f.result() for f in futures]
+    return vote_on(replies, db_path)
+
+def vote_on(replies, db_path):
+    """Cluster the (text, cost) replies of one speculative step by execution result."""
+    sqls = [clean_query(text) for text, _ in replies]
+    clusters, _, failed = cluster_by_result(sqls, db_path)
+    vote = Vote(sqls, clusters, failed, sum(cost for _, cost in replies))
+    event("vote", candidates=len(sqls), clusters=len(clusters), failed=failed, agreement=round(vote.agreement, 3))
+    return vote
+
+def generate_sql(prompt, model, db_path, generate=None):
+    """One cleaned SQL for `prompt`: the greedy reply, or the majority vote when SPEC_CANDIDATES > 1."""
+    generate = generate or LLM_generation
+    if spec_candidates() <= 1:
+        text, _ = generate(prompt, model=model)
+        return clean_query(text)
+    return speculate(prompt, model, db_path, generate=generate).sql
+
+async def agenerate_sql(llm, prompt, model, db_path, executor=None):
+    """generate_sql on an AsyncLLMClient; candidates are awaited together and executed in `executor`."""
+    n = spec_candidates()
+    if n <= 1:
+        text, _ = await llm.agenerate(prompt, model=model)
+        return clean_query(text)
+    temperature = spec_temperature()
+    replies = await asyncio.gather(*[llm.agenerate(prompt, model=model, temperature=0.0 if i == 0 else temperature) for i in range(n)])
+    loop = asyncio.get_running_loop()
+    vote = await loop.run_in_executor(executor, contextvars.copy_context().run, vote_on, replies, db_path)
+    return vote.sql
@@ -0,0 +1,151 @@
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from ..utils.tracing import current_span, step
+
+# USD per 1M (prompt, completion) tokens; LLM_PRICES='{"model": [in, out]}' adds or overrides
+_DEFAULT_PRICES = {
+    'gpt-3.5-turbo': (0.5, 1.5),
+    'gpt-4o-mini': (0.15, 0.6),
+    'gpt-4o': (2.5, 10.0),
+    'gpt-4-turbo': (10.0, 30.0),
+    'gpt-4': (30.0, 60.0),
+}
+
+_prices = None
+_prices_lock = threading.Lock()
+
+def _price_table():
+    global _prices
+    with _prices_lock:
+        if _prices is None:
+            table = dict(_DEFAULT_PRICES)
+            raw = os.getenv("LLM_PRICES")
+            if raw:
+                try:
+                    table.update({k: tuple(v) for k, v in json.loads(raw).items()})
+                except Exception as e:
+                    print(f"[ERROR] LLM_PRICES is not valid JSON ({e}); using built-in prices")
+            _prices = table
+        return _prices
+
+def call_cost(model, prompt_tokens, completion_tokens):
+    table = _price_table()
+    price = table.get(model)
+    if price is None:
+        # dated snapshots (gpt-4o-mini-2024-07-18) bill like their base model
+        base = max((m for m in table if model and model.startswith(m)), key=len, default=None)
+        price = table.get(base)
+    if price is None:
+        return 0.0
+    return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+# where the current call comes from: {'section', 'idx', 'round'}; set per job by the scheduler
+_call_context = contextvars.ContextVar("llm_call_context", default=None)
+
+@contextlib.contextmanager
+def call_context(**fields):
+    """Attribute LLM calls made inside the block to a section/sample (and later a round)."""
+    parent = _call_context.get()
+    ctx = dict(parent) if parent else {}
+    ctx.update(fields)
+    token = _call_context.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _call_context.reset(token)
+
+def set_round(round_i):
+    # rounds advance inside one job, so the job's own context dict is updated in place
+    ctx = _call_context.get()
+    if ctx is not None:
+        ctx['round'] = round_i
+    step("round", round=round_i)
+
+class MetricsSink:
+    """Thread-safe collector of one record per LLM call.
+
+    Records carry the call's tag, model, token usage, latency, retries, fallback model and
+    cost, plus the section/sample/round from call_context(). aggregate() groups them for the
+    run summary; export() writes the raw records as JSONL.
+    """
+
+    def __init__(self):
+        self._records = []
+        self._lock = threading.Lock()
+
+    def record(self, **fields):
+        ctx = _call_context.get() or {}
+        rec = {'section': ctx.get('section'), 'idx': ctx.get('idx'), 'round': ctx.get('round', 0)}
+        rec.update(fields)
+        with self._lock:
+            self._records.append(rec)
+        return rec
+
+    def records(self):
+        with self._lock:
+            return list(self._records)
+
+    def reset(self):
+        with self._lock:
+            self._records.clear()
+
+    def aggregate(self, by=('section',)):
+        import pandas as pd
+        df = pd.DataFrame(self.records())
+        if df.empty:
+            return df
+        by = list(by)
+        for col in by:
+            df[col] = df[col].fillna("-")
+        g = df.groupby(by, sort=True)
+        out = g.agg(
+            calls=('tag', 'size'),
+            cached=('cached', 'sum'),
+            prompt_tokens=('prompt_tokens', 'sum'),
+            completion_tokens=('completion_tokens', 'sum'),
+            latency_s=('latency', 'sum'),
+            p95_latency_s=('latency', lambda s: float(s.quantile(0.95))),
+            retries=('retries', 'sum'),
+            fallbacks=('fallback_model', lambda s: int(s.notna().sum())),
+            errors=('ok', lambda s: int((~s.astype(bool)).sum())),
+            cost_usd=('cost', 'sum'),
+        )
+        return out.reset_index()
+
+    def export(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for rec in self.records():
+                f.write(json.dumps(rec, default=str, ensure_ascii=False) + "\n")
+        return path
+
+_sink = None
+_sink_lock = threading.Lock()
+
+def get_metrics_sink():
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                _sink = MetricsSink()
+    return _sink
+
+def record_call(tag, model, prompt_tokens, completion_tokens, started, retries=0, fallback_model=None, cached=False, ok=True, estimated=False):
+    """Record one LLM call and return its cost in USD (0.0 for cache hits and stubs)."""
+    cost = 0.0 if cached or estimated else call_cost(fallback_model or model, prompt_tokens, completion_tokens)
+    current_span().set(tag=tag, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, retries=retries,
+                       fallback_model=fallback_model, cached=cached, ok=ok, cost=cost)
+    if os.getenv("LLM_METRICS", "1") != "1":
+        return cost
+    get_metrics_sink().record(
+        tag=tag, model=model, fallback_model=fallback_model, prompt_tokens=int(prompt_tokens or 0),
+        completion_tokens=int(completion_tokens or 0), latency=time.perf_counter() - started,
+        retries=retries, cached=cached, ok=ok, estimated=estimated, cost=cost, ts=time.time(),
+    )
+    return cost
@@ -7,11 +7,13 @@ from pydantic import BaseModel
 
 # Import internal modules
 # Ensure engineering is in python path or run from root
-from engineering.db.locator import get_schema
+from engineering.db.locator import get_schema, get_db_path
 from engineering.llm.client import LLM_generation
+from engineering.llm.cache import get_response_cache
+from engineering.llm.speculative import spec_candidates, speculate
 from engineering.llm.prompts import build_metadata_constraints, SRA, cq_prefix_v1, feedback_v2, feedback_prefix_v1, fix_invalid_v1
 from engineering.utils.sanitize import clean_query
-from engineering.pipeline import _QuestionBankVectorStore, is_ambiguous_llm
+from engineering.pipeline import load_fewshot_store, is_ambiguous_llm
 from engineering.io.paths import PROJECT_ROOT
 from engineering.llm.fewshot import get_few_shot_examples
 
@@ -26,9 +28,9 @@ async def lifespan(app: FastAPI):
     embed_model = os.getenv('EMBED_MODEL', 'text-embedding-ada-002')
     
     print(f"Initializing VectorStore from {qb_dir}...")
-    if os.path.exists(qb_dir):
+    if os.path.exists(qb_dir) or os.getenv('FEWSHOT_BACKEND', 'questionbank').lower() == 'chroma':
         try:
-            vector_store = _QuestionBankVectorStore(qb_dir, db_filter=None, embed_model=embed_model)
+            vector_store = load_fewshot_store(qb_dir, embed_model=embed_model)
             print("VectorStore initialized successfully.")
         except Exception as e:
             print(f"Failed to initialize VectorStore: {e}")
@@ -67,6 +69,10 @@ class SQLGenerationRequest(BaseModel):
 class SQLGenerationResponse(BaseModel):
     sql: str
     prompt_used: Optional[str] = None
+    # only set when SPEC_CANDIDATES > 1: share of candidates agreeing with `sql` and whether to ask the user
+    agreement: Optional[float] = None
+    needs_clarification: Optional[bool] = None
+    alternatives: Optional[List[str]] = None
 
 class FixSQLRequest(BaseModel):
     nlq: str
@@ -92,6 +98,13 @@ class ClarificationResponse(BaseModel):
 def health_check():
     return {"status": "ok", "vector_store_loaded": vector_store is not None}
 
+@app.get("/cache/stats")
+def cache_stats_endpoint():
+    cache = get_response_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
 @app.get("/schema/{db_id}", response_model=SchemaResponse)
 def get_schema_endpoint(db_id: str):
     schema_str = get_schema(db_id)
@@ -136,6 +149,11 @@ def generate_sql_endpoint(req: SQLGenerationRequest):
             f"/* Given the following database schema: */\n{schema_str}\n{meta}\n/* Answer the following with no explanation: {req.nlq} */"
         )
     
+    db_path = get_db_path(req.db_id)
+    if spec_candidates() > 1 and db_path:
+        vote = speculate(initial_prompt, req.model, db_path)
+        return SQLGenerationResponse(sql=vote.sql, prompt_used=initial_prompt, agreement=vote.agreement,
+                                     needs_clarification=vote.needs_clarification, alternatives=vote.alternatives())
     sql, _ = LLM_generation(initial_prompt, model=req.model)
     sql = clean_query(sql)
     return SQLGenerationResponse(sql=sql, prompt_used=initial_prompt)
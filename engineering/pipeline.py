@@ -9,9 +9,14 @@ try:
     from engineering.experiments.baseline import run_m1_sample
     from engineering.experiments.sphinteract import run_m2_sample
     from engineering.experiments.break_no_ambiguity import run_m3_sample
+    from engineering.experiments.dialogue import StageStore, shared_stages
     from engineering.db.locator import get_schema
     from engineering.llm.client import LLM_generation
     from engineering.debug.flow_demo import build_demo_db, make_samples
+    from engineering.scheduler import CheckpointLog, pipeline_workers, run_fingerprint, run_sections
+    from engineering.llm.ambiguity import classify_ambiguity, get_verdict_store
+    from engineering.llm.telemetry import call_context, get_metrics_sink
+    from engineering.utils.tracing import DEBUG, WARN, event, span
 except ModuleNotFoundError:
     import sys
     _root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -22,15 +27,20 @@ except ModuleNotFoundError:
     from engineering.experiments.baseline import run_m1_sample
     from engineering.experiments.sphinteract import run_m2_sample
     from engineering.experiments.break_no_ambiguity import run_m3_sample
+    from engineering.experiments.dialogue import StageStore, shared_stages
     from engineering.db.locator import get_schema
     from engineering.llm.client import LLM_generation
     from engineering.debug.flow_demo import build_demo_db, make_samples
+    from engineering.scheduler import CheckpointLog, pipeline_workers, run_fingerprint, run_sections
+    from engineering.llm.ambiguity import classify_ambiguity, get_verdict_store
+    from engineering.llm.telemetry import call_context, get_metrics_sink
+    from engineering.utils.tracing import DEBUG, WARN, event, span
 
 def is_ambiguous_llm(nlq, schema, model=None):
     if os.getenv("AMBIGUITY_USE_LLM", "1") != "1":
         return False
     m = model or os.getenv("AMBIGUITY_MODEL", "gpt-4o-mini")
-    print(f"[TRACE] is_ambiguous_llm start model={m} nlq_len={len(nlq)}")
+    event("is_ambiguous_llm.start", DEBUG, model=m, nlq_len=len(nlq))
     prompt = (
         "/* Given the following database schema: */\n" + schema + "\n" +
         "/* And the following Natural Language Question: */\n" + nlq + "\n\n" +
@@ -52,16 +62,16 @@ def is_ambiguous_llm(nlq, schema, model=None):
     if m_ans:
         val = m_ans.group(1).lower()
         if val == "yes":
-            print(f"[TRACE] is_ambiguous_llm result=YES resp={txt[:120]}")
+            event("is_ambiguous_llm.result", DEBUG, result="YES", resp=txt[:120])
             return True
-        print(f"[TRACE] is_ambiguous_llm result=NO resp={txt[:120]}")
+        event("is_ambiguous_llm.result", DEBUG, result="NO", resp=txt[:120])
         return False
     pos_yes = u.find("YES")
     pos_no = u.find("NO")
     if pos_yes != -1 and (pos_no == -1 or pos_yes < pos_no):
-        print(f"[TRACE] is_ambiguous_llm result=YES resp={txt[:120]}")
+        event("is_ambiguous_llm.result", DEBUG, result="YES", resp=txt[:120])
         return True
-    print(f"[TRACE] is_ambiguous_llm result=NO resp={txt[:120]}")
+    event("is_ambiguous_llm.result", DEBUG, result="NO", resp=txt[:120])
     return False
 
 def load_kaggle_csv():
@@ -70,7 +80,7 @@ def load_kaggle_csv():
         return pd.DataFrame()
     try:
         df = pd.read_csv(str(p))
-        print(f"[TRACE] load_kaggle_csv path={p} rows={len(df)} cols={len(df.columns)}")
+        event("load_kaggle_csv", path=str(p), rows=len(df), cols=len(df.columns))
         return df
     except Exception:
         return pd.DataFrame()
@@ -83,9 +93,14 @@ class _QuestionBankVectorStore:
     def __init__(self, root_dir, db_filter=None, embed_model=None):
         self.pool = []
         self.embeds = None
+        self.index = None
+        self.lexical = None
         self.embed_model = embed_model
+        self._qvecs = None
         self._load_pool(root_dir, db_filter)
         self._ensure_embeddings()
+        if self.embeds is None:
+            self._ensure_lexical()
 
     def _load_pool(self, root_dir, db_filter):
         import json, glob, os
@@ -105,61 +120,106 @@ class _QuestionBankVectorStore:
                         self.pool.append({'nl': nl, 'gold': gold, 'db_id': dbid})
             except Exception:
                 continue
-        print(f"[TRACE] _QuestionBankVectorStore._load_pool root={root_dir} files={len(files)} loaded_docs={len(self.pool)} filter={db_filter}")
+        event("_QuestionBankVectorStore._load_pool", root=root_dir, files=len(files), loaded_docs=len(self.pool), filter=db_filter)
 
     def _ensure_embeddings(self):
         mode = os.getenv("VECTOR_EMBED_MODE", "token").lower()
         if os.getenv("EMBED_DISABLE", "0") == "1" or mode != "embed":
             self.embeds = None
-            print(f"[TRACE] _QuestionBankVectorStore._ensure_embeddings disabled mode={mode}")
+            event("_QuestionBankVectorStore._ensure_embeddings", status="disabled", mode=mode)
             return
-        from engineering.llm.client import embed_texts
+        from engineering.llm.client import embed_texts, embedding_namespace
+        from engineering.llm.embed_store import get_embedding_store, normalize_rows
+        from engineering.llm.ann import build_index
         texts_all = [x['nl'] for x in self.pool]
-        print(f"[TRACE] _QuestionBankVectorStore._ensure_embeddings texts={len(texts_all)} mode={mode}")
+        event("_QuestionBankVectorStore._ensure_embeddings", texts=len(texts_all), mode=mode)
         if not texts_all:
-            self.embeds = np.zeros((0, 1), dtype=float)
-            print("[TRACE] _QuestionBankVectorStore._ensure_embeddings no_texts")
+            self.embeds = np.zeros((0, 1), dtype=np.float32)
+            self.index = build_index(self.embeds)
+            event("_QuestionBankVectorStore._ensure_embeddings", status="no_texts")
             return
         try:
-            max_docs = int(os.getenv("EMBED_MAX_DOCS", "256"))
+            # 0 (the default) embeds the whole bank
+            max_docs = int(os.getenv("EMBED_MAX_DOCS", "0"))
         except Exception:
-            max_docs = 256
+            max_docs = 0
         try:
             batch = int(os.getenv("EMBED_BATCH_SIZE", "64"))
         except Exception:
             batch = 64
-        texts = texts_all[:max_docs]
-        vecs_all = []
-        for i in range(0, len(texts), batch):
-            chunk = texts[i:i+batch]
-            v = embed_texts(chunk, model=self.embed_model)
-            if not v:
-                self.embeds = None
-                print("[TRACE] _QuestionBankVectorStore._ensure_embeddings embed_chunk_failed; fallback token")
-                return
-            vecs_all.extend(v)
-            print(f"[TRACE] _QuestionBankVectorStore._ensure_embeddings progress {i+len(chunk)}/{len(texts)}")
-        self.embeds = np.array(vecs_all, dtype=float)
-        print(f"[TRACE] _QuestionBankVectorStore._ensure_embeddings created_embeddings shape={self.embeds.shape}")
+        if max_docs > 0 and max_docs < len(texts_all):
+            event("_QuestionBankVectorStore._ensure_embeddings", status="capped", docs=max_docs, total=len(texts_all))
+            self.pool = self.pool[:max_docs]
+            texts_all = texts_all[:max_docs]
+        embed_fn = lambda chunk: embed_texts(chunk, model=self.embed_model)
+        progress = lambda done, total: event("_QuestionBankVectorStore._ensure_embeddings.progress", done=done, total=total)
+        store = get_embedding_store(embedding_namespace(self.embed_model))
+        if store is not None:
+            self.embeds = store.embed(texts_all, embed_fn, batch_size=batch, progress=progress)
+        else:
+            vecs_all = []
+            for i in range(0, len(texts_all), batch):
+                v = embed_fn(texts_all[i:i+batch])
+                if not v:
+                    vecs_all = None
+                    break
+                vecs_all.extend(v)
+                progress(i + len(v), len(texts_all))
+            self.embeds = normalize_rows(vecs_all) if vecs_all else None
+        if self.embeds is None:
+            event("_QuestionBankVectorStore._ensure_embeddings", WARN, status="embed_chunk_failed", fallback="token")
+            return
+        self.index = build_index(self.embeds)
+        event("_QuestionBankVectorStore._ensure_embeddings", status="created", shape=self.embeds.shape, index=self.index.kind, store='yes' if store is not None else 'no')
+
+    def _ensure_lexical(self):
+        mode = os.getenv("VECTOR_LEXICAL", "bm25").lower()
+        if mode != "bm25":
+            event("_QuestionBankVectorStore._ensure_lexical", mode=mode)
+            return
+        from engineering.llm.bm25 import BM25Index
+        self.lexical = BM25Index([x['nl'] for x in self.pool], groups=[x['db_id'] for x in self.pool])
+        event("_QuestionBankVectorStore._ensure_lexical", mode="bm25", docs=self.lexical.n, terms=len(self.lexical.postings))
+
+    def prefetch_queries(self, queries):
+        """Embed query texts in batches ahead of the few-shot sections (embed mode only)."""
+        if self.embeds is None:
+            return 0
+        return self._query_cache().prefetch(queries)
+
+    def _query_cache(self):
+        if self._qvecs is None:
+            from engineering.llm.embed_store import QueryVectorCache
+            self._qvecs = QueryVectorCache(self.embed_model)
+        return self._qvecs
 
-    def similarity_search(self, query, k=3):
+    def _rows_for_db(self, db_id):
+        if not hasattr(self, '_db_rows'):
+            rows = {}
+            for i, x in enumerate(self.pool):
+                rows.setdefault(x['db_id'], []).append(i)
+            self._db_rows = {d: np.asarray(r, dtype=np.int64) for d, r in rows.items()}
+        return self._db_rows.get(db_id, np.zeros(0, dtype=np.int64))
+
+    def similarity_search(self, query, k=3, db_id=None):
         if len(self.pool) == 0:
             return []
         q_norm = query.strip().lower()
         docs = []
-        print(f"[TRACE] _QuestionBankVectorStore.similarity_search start k={k} pool={len(self.pool)} embeds={'yes' if self.embeds is not None else 'no'} query={query[:80]}")
+        event("_QuestionBankVectorStore.similarity_search", DEBUG, k=k, pool=len(self.pool), embeds='yes' if self.embeds is not None else 'no', db_id=db_id, query=query[:80])
         if self.embeds is not None:
-            from engineering.llm.client import embed_texts
-            qv_list = embed_texts([query], model=self.embed_model)
-            if not qv_list:
-                print("[TRACE] _QuestionBankVectorStore.similarity_search embed_query_failed")
+            from engineering.llm.ann import FlatIndex
+            qv = self._query_cache().get(query)
+            if qv is None:
+                event("_QuestionBankVectorStore.similarity_search", WARN, status="embed_query_failed")
                 return []
-            qv = np.array(qv_list[0], dtype=float)
-            mat = self.embeds
-            denom = (np.linalg.norm(mat, axis=1) * np.linalg.norm(qv) + 1e-9)
-            sims = (mat @ qv) / denom
-            idxs = np.argsort(sims)[-k:][::-1]
-            print(f"[TRACE] _QuestionBankVectorStore.similarity_search top_idxs={idxs.tolist()}")
+            if db_id is not None:
+                rows = self._rows_for_db(db_id)
+                sub, _ = FlatIndex(self.embeds[rows]).search(qv, k)
+                idxs = rows[sub]
+            else:
+                idxs, _ = self.index.search(qv, k)
+            event("_QuestionBankVectorStore.similarity_search", DEBUG, top_idxs=idxs.tolist())
             for i in idxs:
                 nl = self.pool[i]['nl']
                 gold = self.pool[i]['gold']
@@ -167,23 +227,45 @@ class _QuestionBankVectorStore:
                     continue
                 docs.append(_CSVDoc(nl, gold, ''))
             return docs
+        if self.lexical is not None:
+            hits = self.lexical.search(query, k, group=db_id)
+            event("_QuestionBankVectorStore.similarity_search", DEBUG, bm25_top_scores=[round(s, 3) for _, s in hits[:min(k,5)]])
+            for i, _ in hits:
+                nl = self.pool[i]['nl']
+                if nl.strip().lower() == q_norm:
+                    continue
+                docs.append(_CSVDoc(nl, self.pool[i]['gold'], ''))
+            return docs
         # Fallback: token overlap similarity across question bank
         q_tokens = set(re.findall(r"\w+", q_norm))
         scored = []
         for item in self.pool:
+            if db_id is not None and item['db_id'] != db_id:
+                continue
             nl = item['nl']
             gold = item['gold']
             t = set(re.findall(r"\w+", nl.lower()))
             s = len(q_tokens.intersection(t))
             scored.append((s, nl, gold))
         scored.sort(key=lambda x: x[0], reverse=True)
-        print(f"[TRACE] _QuestionBankVectorStore.similarity_search fallback_top_scores={[s for s,_,_ in scored[:min(k,5)]]}")
+        event("_QuestionBankVectorStore.similarity_search", DEBUG, fallback_top_scores=[s for s,_,_ in scored[:min(k,5)]])
         for s, nl, gold in scored[:k]:
             if nl.strip().lower() == q_norm:
                 continue
             docs.append(_CSVDoc(nl, gold, ''))
         return docs
 
+def load_fewshot_store(qb_dir, embed_model=None):
+    # FEWSHOT_BACKEND=chroma serves few-shot examples from the persisted user-study collection
+    backend = os.getenv('FEWSHOT_BACKEND', 'questionbank').lower()
+    if backend == 'chroma':
+        from engineering.llm.chroma_store import get_chroma_retriever
+        try:
+            return get_chroma_retriever(embed_model=embed_model)
+        except Exception as e:
+            print(f"[ERROR] chroma retriever unavailable ({e}); using the question bank")
+    return _QuestionBankVectorStore(qb_dir, db_filter=None, embed_model=embed_model)
+
 def _map_columns(df):
     cols = set(df.columns)
     nl_col = None
@@ -211,8 +293,38 @@ def extract_ambiguous_samples(csv_df, db_name, k=10):
         raise ValueError('kaggle_dataset.csv must contain a natural language column such as nl/question/nlq')
     if sql_col is None:
         raise ValueError('kaggle_dataset.csv must contain a SQL column such as sql/gold/gold_sql/query')
-    print(f"[TRACE] extract_ambiguous_samples start db={db_name} rows={len(csv_df)} nl_col={nl_col} sql_col={sql_col} db_col={db_col}")
+    event("extract_ambiguous_samples.start", db=db_name, rows=len(csv_df), nl_col=nl_col, sql_col=sql_col, db_col=db_col)
+    use_llm = os.getenv("AMBIGUITY_USE_LLM", "1") == "1"
+    model = os.getenv("AMBIGUITY_MODEL", "gpt-4o-mini")
+    try:
+        batch_size = int(os.getenv("AMBIGUITY_BATCH_SIZE", "20"))
+    except Exception:
+        batch_size = 20
+    try:
+        workers = int(os.getenv("AMBIGUITY_WORKERS", "4"))
+    except Exception:
+        workers = 4
+    # classify a window of candidates at a time so we stop soon after k hits
+    window = max(1, batch_size) * max(1, workers)
+    store = get_verdict_store() if use_llm else None
     rows = []
+    pending = []
+    schemas = {}
+
+    def flush():
+        verdicts = {}
+        if use_llm:
+            items = [(c['db_id'], c['nl']) for c in pending]
+            verdicts = classify_ambiguity(items, schemas, model, is_ambiguous_llm, batch_size=batch_size, max_workers=workers, store=store)
+        for c in pending:
+            if len(rows) >= k:
+                break
+            amb = verdicts.get((c['db_id'], c['nl']), False) if use_llm else True
+            if amb:
+                rows.append(c)
+                event("extract_ambiguous_samples.accepted", DEBUG, nl_len=len(c['nl']), db=c['db_id'], total=len(rows))
+        pending.clear()
+
     for _, r in csv_df.iterrows():
         nl = str(r.get(nl_col, ''))
         if not nl:
@@ -231,19 +343,18 @@ def extract_ambiguous_samples(csv_df, db_name, k=10):
         if not schema:
             print(f"[ERROR] Skip row: missing schema for db={row_db}")
             continue
-        if os.getenv("AMBIGUITY_USE_LLM", "1") == "1":
-            amb = is_ambiguous_llm(nl, schema)
-        else:
-            amb = True
-        if amb:
-            rows.append({'nl': nl, 'sql': sql_val, 'db_id': row_db})
-            print(f"[TRACE] extract_ambiguous_samples accepted nl_len={len(nl)} db={row_db} total={len(rows)}")
+        schemas[row_db] = schema
+        pending.append({'nl': nl, 'sql': sql_val, 'db_id': row_db})
+        if len(pending) >= (window if use_llm else 1):
+            flush()
         if len(rows) >= k:
             break
+    if pending and len(rows) < k:
+        flush()
     if len(rows) < k:
         raise ValueError(f'Found only {len(rows)} ambiguous samples; need {k}. Please expand the dataset.')
     df = pd.DataFrame(rows)
-    print(f"[TRACE] extract_ambiguous_samples done count={len(df)}")
+    event("extract_ambiguous_samples.done", count=len(df))
     return df, df.copy()
 
 def run_section(name, func, samples, model, max_rounds, n_shots, vectorstore):
@@ -251,8 +362,9 @@ def run_section(name, func, samples, model, max_rounds, n_shots, vectorstore):
     dbg = debug_wrapper(func)
     res = []
     for idx, row in samples.iterrows():
-        print(f"[TRACE] run_section dispatch idx={idx} n_shots={n_shots} rounds={max_rounds}")
-        out = dbg((idx, row, model, max_rounds, n_shots, vectorstore))
+        event("run_section.dispatch", DEBUG, idx=idx, n_shots=n_shots, rounds=max_rounds)
+        with call_context(section=name, idx=idx, round=0), span("sample", section=name, idx=idx):
+            out = dbg((idx, row, model, max_rounds, n_shots, vectorstore))
         if out:
             res.append(out)
     return pd.DataFrame(res)
@@ -272,25 +384,73 @@ def _calc_method_stats(df):
     avg_rounds = float(rpos.mean()) if len(rpos) > 0 else 0.0
     return total, init_ok, fix_ok, sra_ok, avg_rounds
 
+def _report_llm_metrics(sink):
+    by_section = sink.aggregate(['section'])
+    if by_section.empty:
+        print("LLM calls: none recorded")
+        return by_section, by_section
+    by_round = sink.aggregate(['section', 'round'])
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print('===== LLM Calls by Section =====')
+        print(by_section.to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+        print('===== LLM Calls by Round =====')
+        print(by_round.to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+    if os.getenv('LLM_METRICS_PATH'):
+        path = sink.export(os.getenv('LLM_METRICS_PATH'))
+        event("run_pipeline", llm_metrics=str(path))
+    return by_section, by_round
+
 def run_pipeline(use_mock=False, max_rounds=4, n_shots_few=2):
-    print(f"[TRACE] run_pipeline start use_mock={use_mock} max_rounds={max_rounds} n_shots_few={n_shots_few}")
+    event("run_pipeline.start", use_mock=use_mock, max_rounds=max_rounds, n_shots_few=n_shots_few)
+    metrics = get_metrics_sink()
+    metrics.reset()
     csv_df = load_kaggle_csv()
     # Randomly shuffle the dataframe to ensure random sampling
     csv_df = csv_df.sample(frac=1, random_state=42).reset_index(drop=True)
     k_target = int(os.getenv('AMBIGUITY_TARGET_COUNT', '10'))
     samples, df_full = extract_ambiguous_samples(csv_df, os.getenv('DEFAULT_DB', ''), k_target)
-    print(f"[TRACE] run_pipeline ambiguous_samples={len(samples)}")
+    event("run_pipeline", ambiguous_samples=len(samples))
     qb_dir = os.getenv('KAGGLE_QUESTION_BANK_DIR', str(PROJECT_ROOT / 'KaggleDBQA-main' / 'examples'))
-    vs = _QuestionBankVectorStore(qb_dir, db_filter=None, embed_model=os.getenv('EMBED_MODEL', 'text-embedding-ada-002'))
-    print(f"[TRACE] run_pipeline vectorstore_pool={len(vs.pool)} qb_dir={qb_dir}")
+    vs = load_fewshot_store(qb_dir, embed_model=os.getenv('EMBED_MODEL', 'text-embedding-ada-002'))
+    event("run_pipeline", vectorstore_pool=len(vs.pool), qb_dir=qb_dir)
+    if n_shots_few > 0:
+        vs.prefetch_queries([str(x) for x in samples['nl']])
     model = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
-    print(f"[TRACE] run_pipeline model={model}")
-    res_m1_zero = run_section('===== M1 Zero-Shot (Baseline) =====', run_m1_sample, samples, model, max_rounds, 0, None)
-    res_m2_zero = run_section('===== M2 Zero-Shot =====', run_m2_sample, samples, model, max_rounds, 0, None)
-    res_m3_zero = run_section('===== M3 Zero-Shot =====', run_m3_sample, samples, model, max_rounds, 0, None)
-    res_m1_few = run_section('===== M1 Few-Shot =====', run_m1_sample, samples, model, max_rounds, n_shots_few, vs)
-    res_m2_few = run_section('===== M2 Few-Shot =====', run_m2_sample, samples, model, max_rounds, n_shots_few, vs)
-    res_m3_few = run_section('===== M3 Few-Shot =====', run_m3_sample, samples, model, max_rounds, n_shots_few, vs)
+    event("run_pipeline", model=model)
+    sections = [
+        ('res_m1_zero', '===== M1 Zero-Shot (Baseline) =====', run_m1_sample, 0, None),
+        ('res_m2_zero', '===== M2 Zero-Shot =====', run_m2_sample, 0, None),
+        ('res_m3_zero', '===== M3 Zero-Shot =====', run_m3_sample, 0, None),
+        ('res_m1_few', '===== M1 Few-Shot =====', run_m1_sample, n_shots_few, vs),
+        ('res_m2_few', '===== M2 Few-Shot =====', run_m2_sample, n_shots_few, vs),
+        ('res_m3_few', '===== M3 Few-Shot =====', run_m3_sample, n_shots_few, vs),
+    ]
+    workers = pipeline_workers()
+    checkpoint = None
+    if os.getenv('PIPELINE_CHECKPOINT_DISABLE', '0') != '1':
+        ckpt_path = os.getenv('PIPELINE_CHECKPOINT') or str(PROJECT_ROOT / '.cache' / 'checkpoints' / f"run_{run_fingerprint(samples, model, max_rounds, n_shots_few, sections)}.jsonl")
+        checkpoint = CheckpointLog(ckpt_path)
+        if os.getenv('PIPELINE_RESUME', '1') != '1':
+            checkpoint.reset()
+    for _, title, _, _, _ in sections:
+        print(title)
+    # the first stage (initial prompt + first fix) is byte-identical across M1/M2/M3 with the same shots
+    stages = StageStore() if os.getenv('PIPELINE_SHARE_STAGES', '1') == '1' else None
+    if stages is not None:
+        with shared_stages(stages):
+            frames = run_sections(sections, samples, model, max_rounds, checkpoint=checkpoint, max_workers=workers, wrap=debug_wrapper)
+        event("run_pipeline.shared_stages", **stages.stats())
+    else:
+        frames = run_sections(sections, samples, model, max_rounds, checkpoint=checkpoint, max_workers=workers, wrap=debug_wrapper)
+    if checkpoint is not None and checkpoint.finalize(len(sections) * len(samples)):
+        # every job finished, so a later run starts fresh instead of replaying these rows
+        event("run_pipeline.checkpoint", finalized=str(checkpoint.path))
+    res_m1_zero = frames['res_m1_zero']
+    res_m2_zero = frames['res_m2_zero']
+    res_m3_zero = frames['res_m3_zero']
+    res_m1_few = frames['res_m1_few']
+    res_m2_few = frames['res_m2_few']
+    res_m3_few = frames['res_m3_few']
     print('===== Summary =====')
     print(f"M1 Zero: {len(res_m1_zero)} rows, acc={res_m1_zero['is_correct'].mean() if not res_m1_zero.empty else 0}")
     print(f"M2 Zero: {len(res_m2_zero)} rows, acc={res_m2_zero['is_correct'].mean() if not res_m2_zero.empty else 0}")
@@ -321,6 +481,7 @@ def run_pipeline(use_mock=False, max_rounds=4, n_shots_few=2):
         print(f"Overall: total={tot} init_ok={init} ({p_init}) fix_ok={fix} ({p_fix}) sra_ok={sra} ({p_sra}) avg_rounds={avg:.2f}")
     else:
         print("Overall: total=0 init_ok=0 (0.00%) fix_ok=0 (0.00%) sra_ok=0 (0.00%) avg_rounds=0.00")
+    llm_by_section, llm_by_round = _report_llm_metrics(metrics)
     return {
         'res_m1_zero': res_m1_zero,
         'res_m2_zero': res_m2_zero,
@@ -328,7 +489,9 @@ def run_pipeline(use_mock=False, max_rounds=4, n_shots_few=2):
         'res_m1_few': res_m1_few,
         'res_m2_few': res_m2_few,
         'res_m3_few': res_m3_few,
-        'samples': samples
+        'samples': samples,
+        'llm_by_section': llm_by_section,
+        'llm_by_round': llm_by_round,
     }
 
 if __name__ == '__main__':
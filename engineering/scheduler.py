@@ -0,0 +1,205 @@
+import asyncio
+import concurrent.futures
+import functools
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+import pandas as pd
+from .experiments.dialogue import arun_dialogue
+from .llm.client import llm_namespace
+from .llm.telemetry import call_context
+from .utils.tracing import event, span
+
+def _json_default(o):
+    if hasattr(o, "item"):
+        return o.item()
+    return str(o)
+
+def _row_fingerprint(row):
+    db = row['target_db'] if 'target_db' in row else row.get('db_id', '')
+    return f"{row['nl']}\x00{row['sql']}\x00{db}"
+
+# switches that change prompts, retrieval, generation or scoring, so results under other values never resume
+_BEHAVIOR_ENV = (
+    "LLM_MODE", "PROMPT_LAYOUT", "SCHEMA_LINK", "SCHEMA_LINK_BUDGET", "SCHEMA_LINK_VALUES", "SCHEMA_LINK_MAX_VALUES",
+    "SPEC_CANDIDATES", "SPEC_TEMPERATURE", "SPEC_AGREEMENT", "M3_DIVERGENCE_CHECK", "RESULT_FLOAT_DECIMALS",
+    "SQL_TIMEOUT", "SQL_MAX_ROWS", "SQL_MAX_BYTES", "FEWSHOT_BACKEND", "EMBED_MODE", "EMBED_MODEL",
+    "VECTOR_INDEX", "VECTOR_LEXICAL", "VECTOR_EMBED_MODE",
+)
+
+@functools.lru_cache(maxsize=1)
+def _code_fingerprint():
+    # the package sources, so an edited method never resumes rows written by the old one
+    h = hashlib.sha256()
+    root = Path(__file__).resolve().parent
+    for p in sorted(root.rglob("*.py")):
+        h.update(p.relative_to(root).as_posix().encode("utf-8"))
+        h.update(p.read_bytes())
+    return h.hexdigest()
+
+def run_fingerprint(samples, model, max_rounds, n_shots_few, sections):
+    h = hashlib.sha256()
+    h.update(f"{llm_namespace(model)}|{max_rounds}|{n_shots_few}|{','.join(s[0] for s in sections)}".encode("utf-8"))
+    for name in _BEHAVIOR_ENV:
+        h.update(f"\x02{name}={os.getenv(name, '')}".encode("utf-8"))
+    h.update(_code_fingerprint().encode("utf-8"))
+    for idx, row in samples.iterrows():
+        h.update(f"\x01{idx}\x00{_row_fingerprint(row)}".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+class CheckpointLog:
+    """Append-only JSONL record of finished (section, sample) jobs."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def load(self):
+        done = {}
+        if not self.path.exists():
+            return done
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except Exception:
+                    # a torn last line from a crash; the job simply runs again
+                    continue
+                done[(rec['section'], rec['idx'])] = rec
+        return done
+
+    def append(self, section, idx, nlq, result):
+        line = json.dumps({'section': section, 'idx': idx, 'nlq': nlq, 'result': result}, default=_json_default, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+
+    def reset(self):
+        with self._lock:
+            if self.path.exists():
+                self.path.unlink()
+
+    def finalize(self, expected):
+        """Delete the log once it holds `expected` jobs; it only exists to resume an interrupted run."""
+        if len(self.load()) < expected:
+            return False
+        self.reset()
+        return True
+
+def scheduler_mode():
+    # PIPELINE_SCHEDULER=async drives dialogue-capable methods from one event loop
+    return "async" if os.getenv("PIPELINE_SCHEDULER", "threads").lower() == "async" else "threads"
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, str(default)))
+    except Exception:
+        return default
+
+def pipeline_workers():
+    # one limit for every experiment runner, not a pool size per method
+    return _env_int("PIPELINE_WORKERS", 8)
+
+async def _run_jobs_async(jobs, run_job, run_dialogue_job, max_workers):
+    """Run every job from one event loop.
+
+    Methods exposing a `dialogue` generator are interleaved as coroutines over a shared
+    AsyncLLMClient, with SQL execution on a small CPU pool; the rest fall back to a thread
+    each from a pool of `max_workers`. PIPELINE_ASYNC_SAMPLES caps the dialogues in flight.
+    """
+    from .llm.async_client import AsyncLLMClient
+    loop = asyncio.get_running_loop()
+    limit = asyncio.Semaphore(max(1, _env_int("PIPELINE_ASYNC_SAMPLES", 1000)))
+    cpu = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, _env_int("PIPELINE_CPU_WORKERS", os.cpu_count() or 4)))
+    threads = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers))
+
+    async def one(llm, key, func, args):
+        if getattr(func, "dialogue", None) is None:
+            return await loop.run_in_executor(threads, run_job, key, func, args)
+        async with limit:
+            return await run_dialogue_job(llm, cpu, key, func, args)
+
+    try:
+        async with AsyncLLMClient() as llm:
+            outs = await asyncio.gather(*[one(llm, key, func, args) for key, func, args in jobs], return_exceptions=True)
+    finally:
+        cpu.shutdown(wait=False)
+        threads.shutdown(wait=False)
+    return outs
+
+def run_sections(sections, samples, model, max_rounds, checkpoint=None, max_workers=8, wrap=None, mode=None):
+    """Fan out every (section, sample) job over a thread pool, or an event loop in async mode.
+
+    `sections` is a list of (key, title, func, n_shots, vectorstore). Finished jobs are
+    appended to `checkpoint` and skipped when it already holds them, so a restarted run
+    only does the remaining work. Returns {key: DataFrame} with rows in sample order,
+    matching what run_section builds.
+    """
+    mode = mode or scheduler_mode()
+    done = checkpoint.load() if checkpoint is not None else {}
+    nlqs = {idx: str(row['nl']) for idx, row in samples.iterrows()}
+    results = {}
+    jobs = []
+    for key, title, func, n_shots, vs in sections:
+        for idx, row in samples.iterrows():
+            rec = done.get((key, idx))
+            if rec is not None and rec.get('nlq') == nlqs[idx]:
+                results[(key, idx)] = rec.get('result')
+                continue
+            jobs.append((key, func, (idx, row, model, max_rounds, n_shots, vs)))
+    event("run_sections", jobs=len(jobs), resumed=len(results), workers=max_workers, mode=mode, checkpoint=checkpoint.path if checkpoint is not None else None)
+
+    def run_job(key, func, args):
+        fn = wrap(func) if wrap is not None else func
+        with call_context(section=key, idx=args[0], round=0), span("sample", section=key, idx=args[0]):
+            out = fn(args)
+        if checkpoint is not None:
+            checkpoint.append(key, args[0], nlqs[args[0]], out)
+        return out
+
+    async def run_dialogue_job(llm, cpu, key, func, args):
+        # the task's own context keeps call attribution and the sample span across awaits
+        with call_context(section=key, idx=args[0], round=0), span("sample", section=key, idx=args[0]):
+            out = await arun_dialogue(func.dialogue(*args), llm, cpu)
+        if checkpoint is not None:
+            checkpoint.append(key, args[0], nlqs[args[0]], out)
+        return out
+
+    if mode == "async":
+        outs = asyncio.run(_run_jobs_async(jobs, run_job, run_dialogue_job, max_workers))
+        for (key, func, args), out in zip(jobs, outs):
+            if isinstance(out, Exception):
+                print(f"[ERROR] run_sections job failed section={key} idx={args[0]}: {out}")
+            else:
+                results[(key, args[0])] = out
+    elif max_workers <= 1:
+        for key, func, args in jobs:
+            try:
+                results[(key, args[0])] = run_job(key, func, args)
+            except Exception as e:
+                print(f"[ERROR] run_sections job failed section={key} idx={args[0]}: {e}")
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(run_job, key, func, args): (key, args[0]) for key, func, args in jobs}
+            for future in concurrent.futures.as_completed(futures):
+                key, idx = futures[future]
+                try:
+                    results[(key, idx)] = future.result()
+                except Exception as e:
+                    print(f"[ERROR] run_sections job failed section={key} idx={idx}: {e}")
+    frames = {}
+    for key, title, func, n_shots, vs in sections:
+        rows = []
+        for idx, _ in samples.iterrows():
+            out = results.get((key, idx))
+            if out:
+                rows.append(out)
+        frames[key] = pd.DataFrame(rows)
+    return frames
@@ -0,0 +1,388 @@
+import atexit
+import contextvars
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+DEBUG, INFO, WARN, ERROR = 10, 20, 30, 40
+_LEVELS = {'debug': DEBUG, 'info': INFO, 'warn': WARN, 'warning': WARN, 'error': ERROR}
+_LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARN: 'WARN', ERROR: 'ERROR'}
+
+_current = contextvars.ContextVar("trace_span", default=None)
+
+class _NoopSpan:
+    """Returned whenever nothing would be recorded; every method is a no-op."""
+    __slots__ = ()
+    sampled = False
+
+    def set(self, **attrs):
+        return self
+
+    def event(self, name, level=INFO, **attrs):
+        pass
+
+    def end(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP = _NoopSpan()
+
+class _Unsampled(_NoopSpan):
+    # an unsampled root still occupies the context so its children are dropped too
+    __slots__ = ("_token",)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        return False
+
+class Span:
+    __slots__ = ("tracer", "name", "level", "trace_id", "span_id", "parent", "start_ns", "end_ns",
+                 "attrs", "events", "error", "is_step", "_step", "_token")
+    sampled = True
+
+    def __init__(self, tracer, name, level, parent, attrs, is_step=False):
+        self.tracer = tracer
+        self.name = name
+        self.level = level
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else "%032x" % random.getrandbits(128)
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attrs = attrs
+        self.events = []
+        self.error = None
+        self.is_step = is_step
+        self._step = None
+        self._token = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def event(self, name, level=INFO, **attrs):
+        if level >= self.tracer.level:
+            self.events.append((time.time_ns(), name, level, attrs))
+            self.tracer._emit_event(name, level, attrs, self)
+
+    def end(self, error=None):
+        if self.end_ns is not None:
+            return
+        if self._step is not None:
+            self._step.end()
+            self._step = None
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self.end_ns = time.time_ns()
+        self.tracer._emit_span(self)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(exc)
+        _current.reset(self._token)
+        return False
+
+class StdoutWriter:
+    """Writes one line per record, serialised across threads so lines never interleave."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def write(self, rec):
+        attrs = rec['attrs']
+        head = [f"[TRACE] {rec['name']}"]
+        if rec['trace_id']:
+            # lines from concurrent samples interleave; the short trace id groups them
+            head.append(f"trace={rec['trace_id'][:8]}")
+        if rec['type'] == 'span':
+            head.append(f"dur_ms={(rec['end_ns'] - rec['start_ns']) / 1e6:.1f}")
+            if rec.get('error'):
+                head.append(f"error={rec['error']!r}")
+        blocks = []
+        for k, v in attrs.items():
+            if v is None:
+                continue
+            s = str(v)
+            if "\n" in s:
+                # prompts and other multi-line payloads go below the header, as before
+                blocks.append(f"[{k}]\n{s}")
+            else:
+                head.append(f"{k}={s}")
+        line = " ".join(head) + "".join("\n" + b for b in blocks) + "\n"
+        with self._lock:
+            self.stream.write(line)
+            self.stream.flush()
+
+    def close(self):
+        pass
+
+def _any_value(v):
+    if isinstance(v, bool):
+        return {'boolValue': v}
+    if isinstance(v, int):
+        return {'intValue': str(v)}
+    if isinstance(v, float):
+        return {'doubleValue': v}
+    return {'stringValue': str(v)}
+
+def _otlp_attrs(attrs):
+    return [{'key': k, 'value': _any_value(v)} for k, v in attrs.items() if v is not None]
+
+def _otlp_batch(records, service):
+    spans, logs = [], []
+    for rec in records:
+        if rec['type'] == 'span':
+            spans.append({
+                'traceId': rec['trace_id'], 'spanId': rec['span_id'], 'parentSpanId': rec['parent_id'] or "",
+                'name': rec['name'], 'kind': 1,
+                'startTimeUnixNano': str(rec['start_ns']), 'endTimeUnixNano': str(rec['end_ns']),
+                'attributes': _otlp_attrs(rec['attrs']),
+                'events': [{'timeUnixNano': str(t), 'name': n, 'attributes': _otlp_attrs(a)} for t, n, _, a in rec['events']],
+                'status': {'code': 2, 'message': rec['error']} if rec.get('error') else {'code': 1},
+            })
+        elif rec['span_id'] is None:
+            # span events travel with their span; only free-standing events become log records
+            logs.append({
+                'timeUnixNano': str(rec['ts_ns']), 'severityText': _LEVEL_NAMES.get(rec['level'], 'INFO'),
+                'severityNumber': {DEBUG: 5, INFO: 9, WARN: 13, ERROR: 17}.get(rec['level'], 9),
+                'body': {'stringValue': rec['name']}, 'attributes': _otlp_attrs(rec['attrs']),
+            })
+    resource = {'attributes': _otlp_attrs({'service.name': service})}
+    scope = {'name': 'engineering.tracing'}
+    out = []
+    if spans:
+        out.append({'resourceSpans': [{'resource': resource, 'scopeSpans': [{'scope': scope, 'spans': spans}]}]})
+    if logs:
+        out.append({'resourceLogs': [{'resource': resource, 'scopeLogs': [{'scope': scope, 'logRecords': logs}]}]})
+    return out
+
+class BufferedFileWriter:
+    """Hands records to a background thread that serialises and appends them in batches.
+
+    The calling thread only enqueues a dict. fmt="jsonl" writes one record per line;
+    fmt="otlp" writes OTLP/JSON ({"resourceSpans": ...}) lines, the format of the
+    OpenTelemetry collector's file exporter.
+    """
+
+    def __init__(self, path, fmt="jsonl", flush_interval=0.2, batch_size=512, service="sphinteract"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fmt = fmt
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.service = service
+        self._q = queue.SimpleQueue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, rec):
+        self._q.put(rec)
+
+    def _drain(self, first):
+        batch = [first] if first is not None else []
+        while len(batch) < self.batch_size:
+            try:
+                rec = self._q.get_nowait()
+            except queue.Empty:
+                break
+            if rec is None:
+                self._closed = True
+                break
+            batch.append(rec)
+        return batch
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        if self.fmt == "otlp":
+            lines = [json.dumps(x, default=str, ensure_ascii=False) for x in _otlp_batch(batch, self.service)]
+        else:
+            lines = [json.dumps(r, default=str, ensure_ascii=False) for r in batch]
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def _run(self):
+        while not self._closed:
+            try:
+                first = self._q.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if first is None:
+                self._closed = True
+                first = None
+            try:
+                self._flush(self._drain(first))
+            except Exception as e:
+                sys.stderr.write(f"[ERROR] trace writer failed ({e})\n")
+
+    def close(self):
+        if self._thread.is_alive():
+            self._q.put(None)
+            self._thread.join(timeout=5)
+        # anything enqueued after the sentinel is written from the caller
+        rest = []
+        while True:
+            try:
+                rec = self._q.get_nowait()
+            except queue.Empty:
+                break
+            if rec is not None:
+                rest.append(rec)
+        self._flush(rest)
+
+class Tracer:
+    """Span and event tracer with a level threshold, per-trace sampling and a pluggable writer.
+
+    With no writer, or below the level threshold, span() hands back a shared no-op object and
+    event() returns immediately, so instrumented code pays for one comparison.
+    """
+
+    def __init__(self, writer=None, level=INFO, sample=1.0):
+        self.writer = writer
+        self.level = level
+        self.sample = sample
+
+    def enabled(self, level=INFO):
+        return self.writer is not None and level >= self.level
+
+    def span(self, name, level=INFO, **attrs):
+        if self.writer is None or level < self.level:
+            return _NOOP
+        parent = _current.get()
+        if parent is not None and not parent.sampled:
+            return _NOOP
+        if parent is None and self.sample < 1.0 and random.random() >= self.sample:
+            return _Unsampled()
+        return Span(self, name, level, parent, attrs)
+
+    def step(self, name, level=INFO, **attrs):
+        """End the current step of the enclosing span (if any) and start the next one.
+
+        Steps are sequential child spans, such as dialogue rounds, that end when the next
+        one starts or when the enclosing span ends.
+        """
+        if self.writer is None or level < self.level:
+            return _NOOP
+        cur = _current.get()
+        if cur is None or not cur.sampled:
+            return _NOOP
+        if cur.is_step:
+            cur.end()
+            cur = cur.parent
+        step = Span(self, name, level, cur, attrs, is_step=True)
+        cur._step = step
+        # the enclosing span's own reset() restores the context past this set
+        _current.set(step)
+        return step
+
+    def event(self, name, level=INFO, **attrs):
+        if self.writer is None or level < self.level:
+            return
+        cur = _current.get()
+        if cur is None:
+            self._emit_event(name, level, attrs, None)
+        elif cur.sampled:
+            cur.event(name, level, **attrs)
+
+    def _emit_event(self, name, level, attrs, span):
+        if self.writer is None:
+            return
+        if span is not None and not isinstance(self.writer, StdoutWriter):
+            # recorded on the span itself and written with it
+            return
+        self.writer.write({
+            'type': 'event', 'name': name, 'level': level, 'ts_ns': time.time_ns(),
+            'trace_id': span.trace_id if span is not None else None,
+            'span_id': span.span_id if span is not None else None, 'attrs': attrs,
+        })
+
+    def _emit_span(self, span):
+        self.writer.write({
+            'type': 'span', 'name': span.name, 'level': span.level, 'trace_id': span.trace_id,
+            'span_id': span.span_id, 'parent_id': span.parent.span_id if span.parent is not None else None,
+            'start_ns': span.start_ns, 'end_ns': span.end_ns, 'attrs': span.attrs,
+            'events': span.events if not isinstance(self.writer, StdoutWriter) else [],
+            'error': span.error,
+        })
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+def _tracer_from_env():
+    sink = os.getenv("TRACE", "stdout").lower()
+    level = _LEVELS.get(os.getenv("TRACE_LEVEL", "info").lower(), INFO)
+    try:
+        sample = float(os.getenv("TRACE_SAMPLE", "1.0"))
+    except Exception:
+        sample = 1.0
+    if sink in ("off", "0", "none", ""):
+        return Tracer(None, level, sample)
+    if sink in ("jsonl", "otlp"):
+        from ..io.paths import PROJECT_ROOT
+        path = os.getenv("TRACE_PATH") or str(PROJECT_ROOT / '.cache' / 'traces' / f"trace_{os.getpid()}.{'otlp.' if sink == 'otlp' else ''}jsonl")
+        try:
+            flush_ms = int(os.getenv("TRACE_FLUSH_MS", "200"))
+        except Exception:
+            flush_ms = 200
+        return Tracer(BufferedFileWriter(path, fmt=sink, flush_interval=flush_ms / 1000.0), level, sample)
+    return Tracer(StdoutWriter(), level, sample)
+
+def get_tracer():
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = _tracer_from_env()
+                atexit.register(_tracer.close)
+    return _tracer
+
+def current_span():
+    cur = _current.get()
+    return cur if cur is not None else _NOOP
+
+# the module-level helpers repeat the level check so a disabled call never reaches the tracer
+
+def span(name, level=INFO, **attrs):
+    t = _tracer or get_tracer()
+    if t.writer is None or level < t.level:
+        return _NOOP
+    return t.span(name, level, **attrs)
+
+def step(name, level=INFO, **attrs):
+    t = _tracer or get_tracer()
+    if t.writer is None or level < t.level:
+        return _NOOP
+    return t.step(name, level, **attrs)
+
+def event(name, level=INFO, **attrs):
+    t = _tracer or get_tracer()
+    if t.writer is None or level < t.level:
+        return
+    t.event(name, level, **attrs)
+
+def enabled(level=INFO):
+    t = _tracer or get_tracer()
+    return t.writer is not None and level >= t.level
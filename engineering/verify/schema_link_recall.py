@@ -0,0 +1,41 @@
+import argparse
+import re
+import sys
+import pandas as pd
+from engineering.io.paths import resolve_dataset_path
+from engineering.db.linker import get_schema_linker
+
+def _refs(cell):
+    # cells look like "['torrents' 'tags']"
+    return re.findall(r"'([^']*)'", str(cell))
+
+def evaluate(df, budget):
+    rows = []
+    for _, row in df.iterrows():
+        if not isinstance(row['target_db'], str):
+            continue
+        linker = get_schema_linker(row['target_db'])
+        if linker is None:
+            continue
+        linked = linker.link(str(row['nl']), budget=budget)
+        t_rec, c_rec = linker.recall(linked, _refs(row['sql_table_refs']), _refs(row['sql_col_refs']))
+        rows.append({'db': row['target_db'], 'table_recall': t_rec, 'column_recall': c_rec,
+                     'tokens': linked.tokens, 'full_tokens': linked.full_tokens, 'pruned': linked.pruned})
+    return pd.DataFrame(rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall of the schema linker against sql_table_refs/sql_col_refs")
+    parser.add_argument("--budgets", default="64,128,256,1024", help="comma-separated token budgets")
+    args = parser.parse_args()
+    path = resolve_dataset_path()
+    if path is None:
+        sys.exit("[ERROR] kaggle_dataset.csv not found; set PROJECT_ROOT or KAGGLE_DATASET_PATH")
+    df = pd.read_csv(path)
+    for budget in [int(b) for b in args.budgets.split(",")]:
+        res = evaluate(df, budget)
+        if res.empty:
+            print(f"budget={budget} no databases found")
+            continue
+        print(f"budget={budget} samples={len(res)} pruned={int(res['pruned'].sum())} "
+              f"table_recall={res['table_recall'].mean():.3f} column_recall={res['column_recall'].mean():.3f} "
+              f"tokens={res['tokens'].mean():.0f}/{res['full_tokens'].mean():.0f}")